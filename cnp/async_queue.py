@@ -0,0 +1,93 @@
+import asyncio
+
+from rich import print
+from cnp.utils import timer
+
+
+class AsyncClosableQueue(asyncio.Queue):
+    SENTINEL = object()
+
+    async def close(self):
+        await self.put(self.SENTINEL)
+
+    async def __aiter__(self):
+        while True:
+            item = await self.get()
+            try:
+                if item is self.SENTINEL:
+                    return
+                yield item
+            finally:
+                self.task_done()
+
+
+async def async_worker(func, in_queue, out_queue):
+    async for item in in_queue:
+        result = await func(item)
+        await out_queue.put(result)
+
+
+def start_tasks(count, func, in_queue, out_queue):
+    # count is the stage's concurrency limit: at most that many items are
+    # in func at once. Each worker is a task, not a thread, so thousands are
+    # cheap.
+    return [
+        asyncio.create_task(async_worker(func, in_queue, out_queue))
+        for _ in range(count)
+    ]
+
+
+async def stop_tasks(closable_queue, tasks):
+    for _ in tasks:
+        await closable_queue.close()
+    await closable_queue.join()
+    await asyncio.gather(*tasks)
+
+
+async def download(item):
+    # Network I/O mock
+    await asyncio.sleep(.003)
+    return item
+
+
+async def resize(item):
+    await asyncio.sleep(.001)
+    return item
+
+
+async def upload(item):
+    # Network I/O mock
+    await asyncio.sleep(.005)
+    return item
+
+
+async def run_task_flow(count, concurrency):
+    download_queue = AsyncClosableQueue()
+    resize_queue = AsyncClosableQueue()
+    upload_queue = AsyncClosableQueue()
+    done_queue = AsyncClosableQueue()
+
+    download_limit, resize_limit, upload_limit = concurrency
+    download_tasks = start_tasks(
+        download_limit, download, download_queue, resize_queue
+    )
+    resize_tasks = start_tasks(
+        resize_limit, resize, resize_queue, upload_queue
+    )
+    upload_tasks = start_tasks(upload_limit, upload, upload_queue, done_queue)
+
+    for _ in range(count):
+        await download_queue.put(object())
+
+    await stop_tasks(download_queue, download_tasks)
+    await stop_tasks(resize_queue, resize_tasks)
+    await stop_tasks(upload_queue, upload_tasks)
+
+    return done_queue.qsize()
+
+
+@timer
+def commence_async_task_flow(count=10000, concurrency=(600, 200, 1000)):
+    # One event loop keeps up to 1800 items in flight
+    finished = asyncio.run(run_task_flow(count, concurrency))
+    print(f'{finished} items finished')
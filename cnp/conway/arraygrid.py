@@ -0,0 +1,118 @@
+import io
+import random
+
+import numpy as np
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import (
+    ALIVE,
+    EMPTY,
+    NEIGHBOR_OFFSETS,
+    Grid,
+    ColumnPrinter,
+    set_grid_random_cells_alive
+)
+
+DEAD_CELL = 0
+LIVE_CELL = 1
+
+
+class ArrayGrid:
+
+    def __init__(self, height, width, cells=None):
+        self.height = height
+        self.width = width
+        if cells is None:
+            cells = np.zeros((height, width), dtype=np.uint8)
+        self.cells = cells
+
+    def get(self, y, x):
+        if self.cells[y % self.height, x % self.width]:
+            return ALIVE
+        return EMPTY
+
+    def set(self, y, x, state):
+        value = LIVE_CELL if state == ALIVE else DEAD_CELL
+        self.cells[y % self.height, x % self.width] = value
+
+    def write(self, stream):
+        # One byte per cell plus a newline column, decoded in a single call
+        symbols = np.full((self.height, self.width + 1), ord('\n'), np.uint8)
+        symbols[:, :self.width] = np.where(self.cells, ord(ALIVE), ord(EMPTY))
+        stream.write(symbols.tobytes().decode('ascii'))
+
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_grid(cls, grid):
+        cells = np.array(
+            [[cell == ALIVE for cell in row] for row in grid.rows],
+            dtype=np.uint8
+        ).reshape(grid.height, grid.width)
+        return cls(grid.height, grid.width, cells)
+
+    def to_grid(self):
+        grid = Grid(self.height, self.width)
+        symbols = np.array([EMPTY, ALIVE])[self.cells]
+        grid.rows = symbols.tolist()
+        return grid
+
+
+def count_neighbors_array(cells):
+    # Works on the last two axes, so a stack of boards is counted at once
+    counts = np.zeros(cells.shape, dtype=np.uint8)
+    for dy, dx in NEIGHBOR_OFFSETS:
+        counts += np.roll(cells, (-dy, -dx), axis=(-2, -1))
+    return counts
+
+
+def step_cells_array(cells):
+    neighbors = count_neighbors_array(cells)
+    born = neighbors == 3
+    survives = (neighbors == 2) & (cells == LIVE_CELL)
+    return (born | survives).astype(np.uint8)
+
+
+@profiled
+def simulate_vectorized(grid):
+    next_cells = step_cells_array(grid.cells)
+    return ArrayGrid(grid.height, grid.width, next_cells)
+
+
+def test_simulate_vectorized():
+    from cnp.conway.grid import step_cell
+
+    grid = Grid(5, 6)
+    grid.set(0, 3, ALIVE)
+    grid.set(1, 4, ALIVE)
+    grid.set(2, 2, ALIVE)
+    grid.set(2, 3, ALIVE)
+    grid.set(2, 4, ALIVE)
+
+    expected = Grid(grid.height, grid.width)
+    for y in range(grid.height):
+        for x in range(grid.width):
+            step_cell(y, x, grid.get, expected.set)
+
+    array_grid = simulate_vectorized(ArrayGrid.from_grid(grid))
+    assert str(array_grid) == str(expected)
+    assert str(array_grid.to_grid()) == str(expected)
+
+
+@timer
+def test_column_printer_with_numpy():
+    columns = ColumnPrinter("Grids Columns with numpy")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns with numpy")
+
+    for i in range(5):
+        grid = ArrayGrid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grid = simulate_vectorized(grid)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
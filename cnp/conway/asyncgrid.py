@@ -1,7 +1,9 @@
+import io
+import json
 import asyncio
 import random
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, profiler, timer
 from cnp.conway.grid import (
     Grid, ColumnPrinter, count_neighbors, set_grid_random_cells_alive
 )
@@ -9,36 +11,190 @@ from cnp.conway.grid import (
 ALIVE = '*'
 EMPTY = '-'
 
+# Seconds each mocked game_logic round trip takes, and whether roughly one
+# call in 2000 fails with OSError
+GAME_LOGIC_LATENCY = .006
+GAME_LOGIC_FAILURES = True
 
+
+@profiled
 async def game_logic(state, neighbors):
     # Blocing I/O Mock
-    if int(random.random() * 1000 // 0.5) == 222:
+    if GAME_LOGIC_FAILURES and int(random.random() * 1000 // 0.5) == 222:
         raise OSError('Get failed')
-    await asyncio.sleep(.006)
+    await asyncio.sleep(GAME_LOGIC_LATENCY)
     if (neighbors == 3 or (neighbors == 2 and state == ALIVE)):
         return ALIVE
     return EMPTY
 
 
-async def step_cell(y, x, get, set):
+async def batch_game_logic(requests):
+    # Batched I/O Mock: one round trip answers every (state, neighbors) pair
+    if GAME_LOGIC_FAILURES and int(random.random() * 1000 // 0.5) == 222:
+        raise OSError('Batch get failed')
+    await asyncio.sleep(GAME_LOGIC_LATENCY)
+    results = []
+    for state, neighbors in requests:
+        if (neighbors == 3 or (neighbors == 2 and state == ALIVE)):
+            results.append(ALIVE)
+        else:
+            results.append(EMPTY)
+    return results
+
+
+class GameLogicBatcher:
+    # Awaitable drop-in for game_logic. Concurrent calls are coalesced into
+    # one batch_logic call once max_size requests are pending or max_delay
+    # seconds have passed, with at most max_batches batches in flight.
+
+    def __init__(
+        self,
+        batch_logic=batch_game_logic,
+        max_size=256,
+        max_delay=.002,
+        max_batches=8,
+    ):
+        self.batch_logic = batch_logic
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_batches = max_batches
+        self.loop = None
+
+    def _bind(self, loop):
+        # asyncio primitives belong to one loop; start afresh on a new one
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(self.max_batches)
+        self.pending = []
+        self.flush_handle = None
+        self.dispatches = set()
+
+    async def __call__(self, state, neighbors):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self._bind(loop)
+
+        future = loop.create_future()
+        self.pending.append(((state, neighbors), future))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            dispatch = asyncio.ensure_future(self._dispatch(batch))
+            self.dispatches.add(dispatch)
+            dispatch.add_done_callback(self.dispatches.discard)
+
+    async def _dispatch(self, batch):
+        requests = [request for request, _ in batch]
+        async with self.semaphore:
+            try:
+                results = list(await self.batch_logic(requests))
+                if len(results) != len(batch):
+                    # zip() would leave the unmatched callers waiting forever
+                    raise ValueError(
+                        f'batch_logic returned {len(results)} results '
+                        f'for {len(batch)} requests'
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def step_cell(y, x, get, set, logic=game_logic):
     state = get(y, x)
     neighbors = count_neighbors(y, x, get)
-    next_state = await game_logic(state, neighbors)
+    next_state = await logic(state, neighbors)
     set(y, x, next_state)
 
 
-async def simulate(grid):
-    next_grid = Grid(grid.height, grid.width)
+@profiled
+async def simulate(grid, logic=game_logic):
+    next_grid = grid.next_generation(Grid)
 
     tasks = []
-    for y in range(grid.height):
-        for x in range(grid.width):
-            task = step_cell(y, x, grid.get, next_grid.set)
-            tasks.append(task)
+    for y, x in grid.cells_to_step():
+        task = step_cell(y, x, grid.get, next_grid.set_next, logic)
+        tasks.append(task)
 
     await asyncio.gather(*tasks)
 
-    return next_grid
+    return next_grid.swap()
+
+
+@profiled
+async def simulate_batched(grid, batcher=None, concurrency=1024):
+    next_grid = grid.next_generation(Grid)
+    if batcher is None:
+        batcher = GameLogicBatcher()
+
+    # A fixed set of steppers share one iterator over the cells, so at most
+    # `concurrency` cells are in flight however large the board is
+    cells = grid.cells_to_step()
+
+    async def stepper():
+        for y, x in cells:
+            await step_cell(y, x, grid.get, next_grid.set_next, batcher)
+
+    await asyncio.gather(*(stepper() for _ in range(concurrency)))
+
+    return next_grid.swap()
+
+
+def test_profiler():
+    global GAME_LOGIC_FAILURES
+    from cnp.conway import grid as grid_module
+
+    # Every game_logic of a generation runs at once under gather, so the
+    # children add up to far more than simulate itself took
+    failures, GAME_LOGIC_FAILURES = GAME_LOGIC_FAILURES, False
+    profiler.reset()
+    profiler.enable()
+    try:
+        grid = Grid(6, 6)
+        set_grid_random_cells_alive(grid, 0.4)
+        asyncio.run(simulate(grid))
+        grid_module.simulate(Grid(2, 2))
+    finally:
+        profiler.disable()
+        GAME_LOGIC_FAILURES = failures
+
+    stream = io.StringIO()
+    profiler.export_folded(stream)
+    folded = {}
+    for line in stream.getvalue().splitlines():
+        stack, _, value = line.rpartition(' ')
+        folded[stack] = int(value)
+    assert folded['asyncgrid.simulate'] == 0
+    assert folded['asyncgrid.simulate;asyncgrid.game_logic'] > 0
+    assert folded['grid.simulate'] >= 0
+    assert folded['grid.simulate;grid.game_logic'] > 0
+
+    stream = io.StringIO()
+    profiler.export_json(stream)
+    calls = {
+        ';'.join(entry['stack']): entry['calls']
+        for entry in json.loads(stream.getvalue())
+    }
+    assert calls == {
+        'asyncgrid.simulate': 1,
+        'asyncgrid.simulate;asyncgrid.game_logic': 36,
+        'grid.simulate': 1,
+        'grid.simulate;grid.game_logic': 4,
+    }
+    profiler.reset()
 
 
 @timer
@@ -55,3 +211,20 @@ def test_column_printer_with_asyncio():
 
     print(columns)
     print(simulated_columns)
+
+
+@timer
+def test_column_printer_with_batched_asyncio():
+    columns = ColumnPrinter("Grids Columns")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns with batching")
+
+    batcher = GameLogicBatcher()
+    for i in range(5):
+        grid = Grid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grid = asyncio.run(simulate_batched(grid, batcher, concurrency=64))
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
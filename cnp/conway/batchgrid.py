@@ -0,0 +1,98 @@
+import random
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import Grid, ColumnPrinter, set_grid_random_cells_alive
+from cnp.conway.arraygrid import ArrayGrid, step_cells_array
+
+
+def stack_grids(grids):
+    layers = []
+    for grid in grids:
+        if not isinstance(grid, ArrayGrid):
+            grid = ArrayGrid.from_grid(grid)
+        layers.append(grid.cells)
+    return np.stack(layers)
+
+
+def step_stack(stack, generations=1):
+    # step_cells_array rolls over the last two axes only, so every board in
+    # the stack wraps around its own edges
+    for _ in range(generations):
+        stack = step_cells_array(stack)
+    return stack
+
+
+@profiled
+def simulate_batch(grids, generations=1, pool=None, boards_per_task=256):
+    # Boards of the same size are stacked and stepped together. With a
+    # process pool, each stack is split into tasks of boards_per_task boards.
+    shapes = defaultdict(list)
+    for index, grid in enumerate(grids):
+        shapes[grid.height, grid.width].append(index)
+
+    results = [None] * len(grids)
+    for (height, width), indices in shapes.items():
+        stack = stack_grids([grids[index] for index in indices])
+        if pool is None:
+            next_stack = step_stack(stack, generations)
+        else:
+            chunks = [
+                stack[i:i + boards_per_task]
+                for i in range(0, len(stack), boards_per_task)
+            ]
+            next_chunks = pool.map(step_stack, chunks, repeat(generations))
+            next_stack = np.concatenate(list(next_chunks))
+        for index, cells in zip(indices, next_stack):
+            results[index] = ArrayGrid(height, width, cells)
+
+    return results
+
+
+def test_simulate_batch():
+    from cnp.conway.arraygrid import simulate_vectorized
+
+    grids = []
+    for _ in range(40):
+        size = random.choice((15, 32, 64))
+        cells = np.random.random((size, size)) < random.uniform(0.06, 0.8)
+        grids.append(ArrayGrid(size, size, cells.astype(np.uint8)))
+    grids.append(Grid(15, 15))
+
+    expected = []
+    for grid in grids:
+        if not isinstance(grid, ArrayGrid):
+            grid = ArrayGrid.from_grid(grid)
+        for _ in range(3):
+            grid = simulate_vectorized(grid)
+        expected.append(str(grid))
+
+    results = simulate_batch(grids, generations=3)
+    assert [str(grid) for grid in results] == expected
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        results = simulate_batch(grids, 3, pool, boards_per_task=4)
+    assert [str(grid) for grid in results] == expected
+
+
+@timer
+def test_column_printer_with_batch():
+    columns = ColumnPrinter("Grids Columns")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns in one batch")
+
+    grids = []
+    for i in range(5):
+        grid = Grid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grids.append(grid)
+
+    for grid in simulate_batch(grids):
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
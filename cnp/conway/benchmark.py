@@ -0,0 +1,234 @@
+"""
+Benchmark every simulate_* backend over a matrix of boards and settings.
+
+    python -m cnp.conway.benchmark --sizes 8,16 --ratios 0.1,0.4 \\
+        --workers 4,16 --latencies 0,0.001 --format csv
+
+Each case runs in a fresh spawned process, so its peak RSS is its own.
+Every generation is checked against the sparse reference simulator.
+"""
+
+import io
+import csv
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import product
+
+from cnp.use_queue import ClosableQueue, start_threads, stop_threads
+from cnp.conway import grid as grid_module
+from cnp.conway import asyncgrid
+from cnp.conway.grid import ALIVE, simulate
+from cnp.conway.lockinggrid import LockingGrid, simulate_threading
+from cnp.conway.queuedgrid import simulate_pipeline
+from cnp.conway.queuedgrid import game_logic_thread as pipeline_logic_thread
+from cnp.conway.queuedlockinggrid import (
+    count_neighbors_thread, game_logic_thread, simulate_phased_pipeline
+)
+from cnp.conway.threadpoolgrid import simulate_pool
+from cnp.conway.sparsegrid import SparseGrid, simulate_sparse
+
+
+@contextlib.contextmanager
+def serial_backend(workers):
+    yield simulate
+
+
+@contextlib.contextmanager
+def threading_backend(workers):
+    # One thread per cell; the worker count doesn't apply
+    yield simulate_threading
+
+
+@contextlib.contextmanager
+def pipeline_backend(workers):
+    in_queue = ClosableQueue()
+    out_queue = ClosableQueue()
+    threads = start_threads(
+        workers, pipeline_logic_thread, in_queue, out_queue
+    )
+    try:
+        yield partial(
+            simulate_pipeline, in_queue=in_queue, out_queue=out_queue
+        )
+    finally:
+        stop_threads(in_queue, threads)
+
+
+@contextlib.contextmanager
+def phased_pipeline_backend(workers):
+    in_queue = ClosableQueue()
+    logic_queue = ClosableQueue()
+    out_queue = ClosableQueue()
+    count_threads = start_threads(
+        workers, count_neighbors_thread, in_queue, logic_queue
+    )
+    logic_threads = start_threads(
+        workers, game_logic_thread, logic_queue, out_queue
+    )
+    try:
+        yield partial(
+            simulate_phased_pipeline,
+            in_queue=in_queue,
+            logic_queue=logic_queue,
+            out_queue=out_queue,
+        )
+    finally:
+        stop_threads(in_queue, count_threads)
+        stop_threads(logic_queue, logic_threads)
+
+
+@contextlib.contextmanager
+def pool_backend(workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield partial(simulate_pool, pool)
+
+
+@contextlib.contextmanager
+def asyncio_backend(workers):
+    yield lambda grid: asyncio.run(asyncgrid.simulate(grid))
+
+
+BACKENDS = {
+    'grid.simulate': serial_backend,
+    'lockinggrid.simulate_threading': threading_backend,
+    'queuedgrid.simulate_pipeline': pipeline_backend,
+    'queuedlockinggrid.simulate_phased_pipeline': phased_pipeline_backend,
+    'threadpoolgrid.simulate_pool': pool_backend,
+    'asyncgrid.simulate': asyncio_backend,
+}
+
+
+def make_board(size, ratio, seed):
+    # Same seed, same board, whichever backend runs it
+    rng = random.Random(seed)
+    grid = LockingGrid(size, size)
+    for _ in range(int(size * size * ratio)):
+        grid.set(rng.randrange(size), rng.randrange(size), ALIVE)
+    return grid
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_case(backend, size, ratio, workers, latency, generations, seed=0):
+    grid_module.GAME_LOGIC_LATENCY = latency
+    asyncgrid.GAME_LOGIC_LATENCY = latency
+    # Injected failures would make results differ between backends
+    asyncgrid.GAME_LOGIC_FAILURES = False
+
+    grid = make_board(size, ratio, seed)
+    expected = SparseGrid.from_grid(grid)
+    identical = True
+    latencies = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with BACKENDS[backend](workers) as step:
+            for _ in range(generations):
+                start = time.perf_counter()
+                grid = step(grid)
+                latencies.append(time.perf_counter() - start)
+                expected = simulate_sparse(expected)
+                identical = identical and str(grid) == str(expected)
+
+    elapsed = sum(latencies)
+    return {
+        'backend': backend,
+        'size': size,
+        'ratio': ratio,
+        'workers': workers,
+        'latency': latency,
+        'generations': generations,
+        'identical': identical,
+        'cells_per_second': size * size * generations / elapsed,
+        'p50_generation_seconds': percentile(latencies, 0.5),
+        'p99_generation_seconds': percentile(latencies, 0.99),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_matrix(
+    backends, sizes, ratios, workers, latencies, generations, isolate=True
+):
+    cases = product(backends, sizes, ratios, workers, latencies)
+    results = []
+    for backend, size, ratio, worker_count, latency in cases:
+        args = (backend, size, ratio, worker_count, latency, generations)
+        if isolate:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                result = executor.submit(run_case, *args).result()
+        else:
+            result = run_case(*args)
+        results.append(result)
+    return results
+
+
+def write_results(results, stream, output_format='json'):
+    if output_format == 'json':
+        json.dump(results, stream, indent=2)
+        stream.write('\n')
+    elif output_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        raise ValueError(f'Unknown format {output_format}')
+
+
+def parse_list(kind):
+    return lambda text: [kind(value) for value in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--backends', type=parse_list(str), default=list(BACKENDS)
+    )
+    parser.add_argument('--sizes', type=parse_list(int), default=[8, 16])
+    parser.add_argument('--ratios', type=parse_list(float), default=[0.2])
+    parser.add_argument('--workers', type=parse_list(int), default=[4, 16])
+    parser.add_argument(
+        '--latencies', type=parse_list(float), default=[0.0, 0.001]
+    )
+    parser.add_argument('--generations', type=int, default=3)
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--output', type=argparse.FileType('w'))
+    parser.add_argument(
+        '--in-process',
+        action='store_true',
+        help='skip the per-case process (faster, but RSS is cumulative)',
+    )
+    args = parser.parse_args(argv)
+
+    unknown = set(args.backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f'Unknown backends: {", ".join(sorted(unknown))}')
+
+    results = run_matrix(
+        args.backends,
+        args.sizes,
+        args.ratios,
+        args.workers,
+        args.latencies,
+        args.generations,
+        isolate=not args.in_process,
+    )
+    write_results(results, args.output or sys.stdout, args.format)
+    mismatched = [result for result in results if not result['identical']]
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import io
+import random
+
+import numpy as np
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import (
+    ALIVE, EMPTY, Grid, ColumnPrinter, set_grid_random_cells_alive
+)
+
+WORD_BITS = 64
+
+_ONE = np.uint64(1)
+_HIGH_BIT = np.uint64(WORD_BITS - 1)
+
+
+def words_per_row(width):
+    return (width + WORD_BITS - 1) // WORD_BITS
+
+
+# Cell x of a row lives at bit x % 64 of word x // 64. Bits past the width
+# in the last word of each row are kept clear.
+class BitGrid:
+
+    def __init__(self, height, width, words=None):
+        self.height = height
+        self.width = width
+        if words is None:
+            words = np.zeros((height, words_per_row(width)), dtype=np.uint64)
+        self.words = words
+
+    def get(self, y, x):
+        y %= self.height
+        x %= self.width
+        word = self.words[y, x // WORD_BITS]
+        if (int(word) >> (x % WORD_BITS)) & 1:
+            return ALIVE
+        return EMPTY
+
+    def set(self, y, x, state):
+        y %= self.height
+        x %= self.width
+        mask = np.uint64(1 << (x % WORD_BITS))
+        if state == ALIVE:
+            self.words[y, x // WORD_BITS] |= mask
+        else:
+            self.words[y, x // WORD_BITS] &= ~mask
+
+    def unpack(self):
+        as_bytes = self.words.astype('<u8').view(np.uint8)
+        bits = np.unpackbits(as_bytes, axis=1, bitorder='little')
+        return bits[:, :self.width]
+
+    def write(self, stream):
+        # One byte per cell plus a newline column, decoded in a single call
+        symbols = np.full((self.height, self.width + 1), ord('\n'), np.uint8)
+        symbols[:, :self.width] = np.where(
+            self.unpack(), ord(ALIVE), ord(EMPTY)
+        )
+        stream.write(symbols.tobytes().decode('ascii'))
+
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_cells(cls, cells):
+        height, width = cells.shape
+        padded = np.zeros(
+            (height, words_per_row(width) * WORD_BITS), dtype=np.uint8
+        )
+        padded[:, :width] = cells
+        as_bytes = np.packbits(padded, axis=1, bitorder='little')
+        words = as_bytes.view('<u8').astype(np.uint64)
+        return cls(height, width, words)
+
+    @classmethod
+    def from_grid(cls, grid):
+        cells = np.array(
+            [[cell == ALIVE for cell in row] for row in grid.rows],
+            dtype=np.uint8
+        ).reshape(grid.height, grid.width)
+        return cls.from_cells(cells)
+
+    def to_grid(self):
+        grid = Grid(self.height, self.width)
+        symbols = np.array([EMPTY, ALIVE])[self.unpack()]
+        grid.rows = symbols.tolist()
+        return grid
+
+
+def _tail_mask(width):
+    # Mask of the valid bits in the last word of a row
+    tail = width % WORD_BITS
+    if tail == 0:
+        return np.uint64(2**WORD_BITS - 1)
+    return np.uint64((1 << tail) - 1)
+
+
+def _shift_west(words, width):
+    # Result bit x holds cell x - 1, with cell width - 1 wrapping to bit 0
+    shifted = words << _ONE
+    shifted[:, 1:] |= words[:, :-1] >> _HIGH_BIT
+    last_bit = np.uint64((width - 1) % WORD_BITS)
+    shifted[:, 0] |= (words[:, -1] >> last_bit) & _ONE
+    shifted[:, -1] &= _tail_mask(width)
+    return shifted
+
+
+def _shift_east(words, width):
+    # Result bit x holds cell x + 1, with cell 0 wrapping to bit width - 1
+    shifted = words >> _ONE
+    shifted[:, :-1] |= words[:, 1:] << _HIGH_BIT
+    last_bit = np.uint64((width - 1) % WORD_BITS)
+    shifted[:, -1] |= (words[:, 0] & _ONE) << last_bit
+    return shifted
+
+
+def _half_adder(a, b):
+    return a ^ b, a & b
+
+
+def _full_adder(a, b, c):
+    partial = a ^ b
+    return partial ^ c, (a & b) | (partial & c)
+
+
+def step_words(words, width):
+    north = np.roll(words, 1, axis=0)
+    south = np.roll(words, -1, axis=0)
+    neighbors = []
+    for row in (north, words, south):
+        neighbors.append(_shift_west(row, width))
+        neighbors.append(_shift_east(row, width))
+    neighbors.append(north)
+    neighbors.append(south)
+
+    # Bit-sliced sum of the eight neighbor planes, counted modulo 8. A
+    # count of 8 wraps to 0, which is dead under the rules just like 8.
+    sum_a, carry_a = _full_adder(*neighbors[0:3])
+    sum_b, carry_b = _full_adder(*neighbors[3:6])
+    sum_c, carry_c = _half_adder(*neighbors[6:8])
+    ones, carry_d = _full_adder(sum_a, sum_b, sum_c)
+    partial_twos, carry_e = _full_adder(carry_a, carry_b, carry_c)
+    twos, carry_f = _half_adder(partial_twos, carry_d)
+    fours = carry_e ^ carry_f
+
+    # Alive with exactly 3 neighbors, or with 2 when already alive
+    return twos & ~fours & (ones | words)
+
+
+@profiled
+def simulate_bits(grid):
+    next_words = step_words(grid.words, grid.width)
+    return BitGrid(grid.height, grid.width, next_words)
+
+
+def test_simulate_bits():
+    from cnp.conway.arraygrid import ArrayGrid, simulate_vectorized
+
+    for height, width in ((1, 1), (3, 5), (15, 15), (9, 64), (7, 130)):
+        cells = (np.random.random((height, width)) < 0.4).astype(np.uint8)
+        expected = simulate_vectorized(ArrayGrid(height, width, cells))
+        bit_grid = simulate_bits(BitGrid.from_cells(cells))
+        assert str(bit_grid) == str(expected)
+        assert str(BitGrid.from_grid(bit_grid.to_grid())) == str(expected)
+
+
+@timer
+def test_column_printer_with_bits():
+    columns = ColumnPrinter("Grids Columns with bits")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns with bits")
+
+    for i in range(5):
+        grid = BitGrid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grid = simulate_bits(grid)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
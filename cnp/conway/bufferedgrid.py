@@ -0,0 +1,80 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+from cnp.utils import timer
+from cnp.use_queue import ClosableQueue, StoppableWorker
+from cnp.conway.grid import (
+    EMPTY, Grid, ColumnPrinter, set_grid_random_cells_alive
+)
+from cnp.conway.lockinggrid import simulate_threading
+from cnp.conway.threadpoolgrid import simulate_pool
+from cnp.conway.queuedlockinggrid import (
+    count_neighbors_thread, game_logic_thread, simulate_phased_pipeline
+)
+
+
+class DoubleBufferedGrid(Grid):
+    # A generation only reads the front buffer and writes each cell of the
+    # back buffer once, so neither side needs a lock. swap() publishes it.
+
+    def __init__(self, height, width):
+        super().__init__(height, width)
+        self.back = []
+        for _ in range(self.height):
+            self.back.append([EMPTY] * self.width)
+
+    def next_generation(self, grid_class):
+        return self
+
+    def set_next(self, y, x, state):
+        self.back[y % self.height][x % self.width] = state
+
+    def swap(self):
+        self.rows, self.back = self.back, self.rows
+        return self
+
+
+@timer
+def test_column_printer_with_double_buffer():
+    columns = ColumnPrinter("Grids Columns with double buffering")
+    simulated_columns = ColumnPrinter(
+        "Simulated Grids Columns with double buffering"
+    )
+
+    in_queue = ClosableQueue()
+    logic_queue = ClosableQueue()
+    out_queue = ClosableQueue()
+
+    threads = []
+    for _ in range(5):
+        thread = StoppableWorker(count_neighbors_thread, in_queue, logic_queue)
+        thread.start()
+        threads.append(thread)
+
+    for _ in range(5):
+        thread = StoppableWorker(game_logic_thread, logic_queue, out_queue)
+        thread.start()
+        threads.append(thread)
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        for i in range(5):
+            grid = DoubleBufferedGrid(15, 15)
+            set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+            columns.append(str(grid))
+            grid = simulate_threading(grid)
+            grid = simulate_pool(pool, grid)
+            grid = simulate_phased_pipeline(
+                grid, in_queue, logic_queue, out_queue
+            )
+            simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
+
+    for thread in threads:
+        in_queue.close()
+    for thread in threads:
+        logic_queue.close()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,136 @@
+import random
+from collections import deque
+from threading import Lock
+
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import (
+    ALIVE, Grid, ColumnPrinter, simulate, set_grid_random_cells_alive
+)
+from cnp.conway.sparsegrid import SparseGrid, simulate_sparse
+
+_MASK_64 = 2**64 - 1
+
+
+def cell_key(y, x):
+    # splitmix64 finalizer over the packed coordinates: a well-mixed 64-bit
+    # key per cell without keeping a table the size of the board
+    z = ((y << 32) ^ x) + 0x9E3779B97F4A7C15 & _MASK_64
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & _MASK_64
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & _MASK_64
+    return z ^ (z >> 31)
+
+
+class HashedGrid(Grid):
+    # digest is the XOR of the keys of all live cells, kept current by set()
+
+    def __init__(self, height, width):
+        super().__init__(height, width)
+        self.digest = 0
+        self.digest_lock = Lock()
+
+    def set(self, y, x, state):
+        y %= self.height
+        x %= self.width
+        was_alive = self.rows[y][x] == ALIVE
+        self.rows[y][x] = state
+        if was_alive != (state == ALIVE):
+            with self.digest_lock:
+                self.digest ^= cell_key(y, x)
+
+    def next_generation(self, grid_class):
+        return HashedGrid(self.height, self.width)
+
+    @classmethod
+    def from_grid(cls, grid):
+        hashed_grid = cls(grid.height, grid.width)
+        for y, row in enumerate(grid.rows):
+            for x, cell in enumerate(row):
+                hashed_grid.set(y, x, cell)
+        return hashed_grid
+
+
+class CycleDetector:
+    # Remembers the last `history` generations, so it finds still lifes and
+    # oscillators with a period of up to `history` generations
+
+    def __init__(self, history=64):
+        self.grids = deque(maxlen=history)
+        self.generations = {}
+        self.start = None
+        self.period = None
+
+    def observe(self, generation, grid):
+        if len(self.grids) == self.grids.maxlen:
+            old_generation, old_grid = self.grids[0]
+            if self.generations.get(old_grid.digest) == old_generation:
+                del self.generations[old_grid.digest]
+        self.grids.append((generation, grid))
+
+        seen_at = self.generations.get(grid.digest)
+        self.generations[grid.digest] = generation
+        if seen_at is None:
+            return None
+        # Rule out a digest collision before trusting the match
+        if self.grid_at(seen_at).rows != grid.rows:
+            return None
+        self.start = seen_at
+        self.period = generation - seen_at
+        return seen_at
+
+    def grid_at(self, generation):
+        first_generation = self.grids[0][0]
+        return self.grids[generation - first_generation][1]
+
+
+def fast_forward(grid, generations, simulate=simulate, history=64):
+    if not isinstance(grid, HashedGrid):
+        grid = HashedGrid.from_grid(grid)
+    detector = CycleDetector(history)
+    detector.observe(0, grid)
+
+    for generation in range(1, generations + 1):
+        grid = simulate(grid)
+        start = detector.observe(generation, grid)
+        if start is not None:
+            # Generation start + k * period repeats this board for every k
+            offset = (generations - start) % detector.period
+            return detector.grid_at(start + offset)
+
+    return grid
+
+
+@profiled
+def simulate_hashed_sparse(grid):
+    sparse_grid = simulate_sparse(SparseGrid.from_grid(grid))
+    return HashedGrid.from_grid(sparse_grid.to_grid())
+
+
+def test_fast_forward():
+    # A blinker next to a block: period 2 from the very first generation
+    grid = Grid(8, 8)
+    for y, x in ((1, 1), (1, 2), (1, 3), (5, 5), (5, 6), (6, 5), (6, 6)):
+        grid.set(y, x, ALIVE)
+
+    expected = SparseGrid.from_grid(grid)
+    for _ in range(7):
+        expected = simulate_sparse(expected)
+
+    detector_grid = fast_forward(grid, 10**9 + 7, simulate_hashed_sparse)
+    assert str(detector_grid) == str(expected)
+
+
+@timer
+def test_column_printer_with_cycles():
+    columns = ColumnPrinter("Grids Columns")
+    simulated_columns = ColumnPrinter("Grids Columns after 10**6 generations")
+
+    for i in range(5):
+        grid = HashedGrid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.2))
+        columns.append(str(grid))
+        grid = fast_forward(grid, 10**6, simulate_hashed_sparse, history=256)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
@@ -0,0 +1,110 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+from cnp.utils import timer
+from cnp.conway.grid import (
+    ColumnPrinter, Grid, simulate, set_grid_random_cells_alive
+)
+from cnp.conway.threadpoolgrid import simulate_pool
+
+
+class DirtyGrid(Grid):
+    # A cell whose 3x3 neighborhood didn't change last generation keeps its
+    # state, so only changed cells and their neighbors need stepping. Past
+    # full_pass_ratio of the board, a plain full pass is cheaper.
+
+    def __init__(self, height, width, full_pass_ratio=0.25):
+        super().__init__(height, width)
+        self.full_pass_ratio = full_pass_ratio
+        # None until the grid comes out of a simulation step: a hand-seeded
+        # board has no previous generation to compare against
+        self.changed = None
+
+    def set(self, y, x, state):
+        y %= self.height
+        x %= self.width
+        if self.rows[y][x] != state:
+            self.rows[y][x] = state
+            if self.changed is not None:
+                self.changed.add((y, x))
+
+    def next_generation(self, grid_class):
+        # Starts as a copy, so cells that aren't stepped carry over
+        next_grid = DirtyGrid(self.height, self.width, self.full_pass_ratio)
+        next_grid.rows = [list(row) for row in self.rows]
+        next_grid.changed = set()
+        return next_grid
+
+    def dirty_cells(self):
+        if self.changed is None:
+            return None
+        limit = self.full_pass_ratio * self.height * self.width
+        if len(self.changed) > limit:
+            return None
+
+        cells = set()
+        for y, x in self.changed:
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    cells.add(((y + dy) % self.height, (x + dx) % self.width))
+        if len(cells) > limit:
+            return None
+        return sorted(cells)
+
+    def cells_to_step(self):
+        cells = self.dirty_cells()
+        if cells is None:
+            return super().cells_to_step()
+        return cells
+
+    def chunks_to_step(self, chunk_size):
+        cells = self.dirty_cells()
+        if cells is None:
+            return super().chunks_to_step(chunk_size)
+        return [
+            cells[i:i + chunk_size] for i in range(0, len(cells), chunk_size)
+        ]
+
+
+def test_simulate_dirty():
+    from cnp.conway.grid import ALIVE
+    from cnp.conway.sparsegrid import SparseGrid, simulate_sparse
+
+    # A glider keeps the dirty region small; a random board mostly takes
+    # the full pass
+    glider = DirtyGrid(16, 16)
+    for y, x in ((0, 1), (1, 2), (2, 0), (2, 1), (2, 2)):
+        glider.set(y, x, ALIVE)
+    soup = DirtyGrid(12, 12)
+    set_grid_random_cells_alive(soup, 0.3)
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        for grid in (glider, soup):
+            expected = SparseGrid.from_grid(grid)
+            for _ in range(15):
+                grid = simulate_pool(pool, grid)
+                expected = simulate_sparse(expected)
+                assert str(grid) == str(expected)
+
+
+@timer
+def test_column_printer_with_dirty_regions():
+    columns = ColumnPrinter("Grids Columns after 10 generations")
+    simulated_columns = ColumnPrinter(
+        "Simulated Grids Columns with dirty regions"
+    )
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        for i in range(5):
+            grid = DirtyGrid(15, 15)
+            set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+            for _ in range(10):
+                grid = simulate_pool(pool, grid)
+            columns.append(str(grid))
+            print(f'Dirty cells: {len(grid.changed)}')
+            grid = simulate(grid)
+            simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
@@ -1,11 +1,20 @@
+import io
 import time
 import random
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 
 ALIVE = '*'
 EMPTY = '-'
 
+# Seconds each mocked game_logic lookup blocks for
+GAME_LOGIC_LATENCY = .009
+
+# Offsets of the eight neighbors, in the same order as count_neighbors
+NEIGHBOR_OFFSETS = (
+    (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)
+)
+
 
 class Grid:
 
@@ -22,13 +31,33 @@ class Grid:
     def set(self, y, x, state):
         self.rows[y % self.height][x % self.width] = state
 
-    def __str__(self):
-        output = ''
+    def next_generation(self, grid_class):
+        # Grid that set_next writes the next generation into
+        return grid_class(self.height, self.width)
+
+    def set_next(self, y, x, state):
+        self.set(y, x, state)
+
+    def swap(self):
+        return self
+
+    def cells_to_step(self):
+        for y in range(self.height):
+            for x in range(self.width):
+                yield (y, x)
+
+    def chunks_to_step(self, chunk_size):
+        return chunk_cells(self.height, self.width, chunk_size)
+
+    def write(self, stream):
         for row in self.rows:
-            for cell in row:
-                output += cell
-            output += '\n'
-        return output
+            stream.write(''.join(row))
+            stream.write('\n')
+
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
 
 
 def count_neighbors(y, x, get):
@@ -68,11 +97,12 @@ def test_count_neighbors():
     assert seen == expected_seen
 
 
+@profiled
 def game_logic(state, neighbors):
     # Blocing I/O Mock
     # if int(random.random() * 1000 // .5) == 222:
     #     raise OSError('Get failed')
-    time.sleep(.009)
+    time.sleep(GAME_LOGIC_LATENCY)
     if (neighbors == 3 or (neighbors == 2 and state == ALIVE)):
         return ALIVE
     return EMPTY
@@ -91,10 +121,10 @@ def test_game_logic():
     assert game_logic(EMPTY, 4) == EMPTY
 
 
-def step_cell(y, x, get, set):
+def step_cell(y, x, get, set, logic=game_logic):
     state = get(y, x)
     neighbors = count_neighbors(y, x, get)
-    next_state = game_logic(state, neighbors)
+    next_state = logic(state, neighbors)
     set(y, x, next_state)
 
 
@@ -124,13 +154,32 @@ def test_step_cell():
     assert new_state == ALIVE
 
 
-def simulate(grid):
-    next_grid = Grid(grid.height, grid.width)
+def step_cells(cells, get, set):
+    for y, x in cells:
+        step_cell(y, x, get, set)
+
+
+def chunk_cells(height, width, chunk_size):
+    # A chunk of at least a row covers whole rows, a smaller one a run of
+    # columns, so chunk_size == width hands out one row per chunk
+    tile_height = max(1, chunk_size // width)
+    tile_width = min(width, max(1, chunk_size))
+    for y0 in range(0, height, tile_height):
+        for x0 in range(0, width, tile_width):
+            chunk = []
+            for y in range(y0, min(y0 + tile_height, height)):
+                for x in range(x0, min(x0 + tile_width, width)):
+                    chunk.append((y, x))
+            yield chunk
+
+
+@profiled
+def simulate(grid, logic=game_logic):
+    next_grid = grid.next_generation(Grid)
 
-    for y in range(grid.height):
-        for x in range(grid.width):
-            step_cell(y, x, grid.get, next_grid.set)
-    return next_grid
+    for y, x in grid.cells_to_step():
+        step_cell(y, x, grid.get, next_grid.set_next, logic)
+    return next_grid.swap()
 
 
 class ColumnPrinter:
@@ -142,29 +191,38 @@ class ColumnPrinter:
     def append(self, data):
         self.columns.append(data)
 
-    def __str__(self):
-        row_count = 1
+    def write(self, stream):
         columns_delimiter = ' | '
-        for data in self.columns:
-            row_count = max(row_count, len(data.splitlines()) + 1)
-        rows = [''] * row_count
-        heading = self.title.center(
-            len(data.splitlines()[0]) * len(self.columns) +
-            len(columns_delimiter) * (len(self.columns) - 1),
-            '='
+        # Split every column once up front, then emit one joined row at a time
+        columns = [data.splitlines() for data in self.columns]
+        row_count = max([len(lines) for lines in columns], default=0)
+        heading_width = 0
+        if columns:
+            heading_width = (
+                len(columns[-1][0]) * len(columns) +
+                len(columns_delimiter) * (len(columns) - 1)
+            )
+
+        stream.write('\n' + self.title.center(heading_width, '=') + '\n')
+        stream.write(
+            columns_delimiter.join(
+                str(i).center(len(lines[0]), ' ')
+                for i, lines in enumerate(columns)
+            )
         )
-        rows[0] += '\n' + heading + '\n'
         for j in range(row_count):
-            for i, data in enumerate(self.columns):
-                line = data.splitlines()[max(0, j - 1)]
-                if j == 0:
-                    rows[j] += str(i).center(len(line), ' ')
-                else:
-                    rows[j] += line
-                if (i + 1) < len(self.columns):
-                    rows[j] += columns_delimiter
+            stream.write('\n')
+            stream.write(
+                columns_delimiter.join(
+                    lines[j] if j < len(lines) else ''
+                    for lines in columns
+                )
+            )
 
-        return '\n'.join(rows)
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
 
 
 def set_grid_random_cells_alive(grid: Grid, ratio: float):
@@ -180,6 +238,15 @@ def set_grid_random_cells_alive(grid: Grid, ratio: float):
     print(grid)
 
 
+def write_generations(grid, generations, stream, simulate=simulate):
+    for generation in range(generations + 1):
+        if generation:
+            grid = simulate(grid)
+        stream.write(f'Generation {generation}\n')
+        grid.write(stream)
+    return grid
+
+
 @timer
 def test_column_printer():
     columns = ColumnPrinter("Grids Columns")
@@ -0,0 +1,389 @@
+"""
+Memoized quadtree (HashLife) engine.
+
+The quadtree models the unbounded plane rather than the torus that
+Grid.get wraps around, so results match simulate() only while the pattern
+stays clear of the board edges. Cells that leave the board are dropped
+when converting back with to_grid().
+"""
+
+import random
+from collections import OrderedDict
+
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import ALIVE, EMPTY, Grid, ColumnPrinter
+
+
+class Node:
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population', '_hash')
+
+    def __init__(self, level, nw, ne, sw, se, population, hash_value):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+        self._hash = hash_value
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        # Canonical nodes compare by identity. Structural comparison is only
+        # needed once an equal node has been evicted and rebuilt.
+        if self is other:
+            return True
+        if self._hash != other._hash or self.level != other.level:
+            return False
+        if self.level == 0:
+            return self.population == other.population
+        return (
+            self.nw == other.nw and self.ne == other.ne and
+            self.sw == other.sw and self.se == other.se
+        )
+
+
+class LRUCache:
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class HashLife:
+
+    def __init__(self, cache_size=2**20):
+        self.nodes = LRUCache(cache_size)
+        self.results = LRUCache(cache_size)
+        self.empties = {}
+        self.off = Node(0, None, None, None, None, 0, 0)
+        self.on = Node(0, None, None, None, None, 1, 1)
+
+    def join(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            population = (
+                nw.population + ne.population + sw.population + se.population
+            )
+            hash_value = hash((nw._hash, ne._hash, sw._hash, se._hash))
+            node = Node(nw.level + 1, nw, ne, sw, se, population, hash_value)
+            self.nodes.put(key, node)
+        return node
+
+    def empty(self, level):
+        node = self.empties.get(level)
+        if node is None:
+            if level == 0:
+                node = self.off
+            else:
+                child = self.empty(level - 1)
+                node = self.join(child, child, child, child)
+            self.empties[level] = node
+        return node
+
+    def centre(self, node):
+        # One level up, with node in the middle of the new square
+        zero = self.empty(node.level - 1)
+        return self.join(
+            self.join(zero, zero, zero, node.nw),
+            self.join(zero, zero, node.ne, zero),
+            self.join(zero, node.sw, zero, zero),
+            self.join(node.se, zero, zero, zero),
+        )
+
+    def _life_4x4(self, node):
+        cells = [
+            [node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+            [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+            [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+            [node.sw.sw, node.sw.se, node.se.sw, node.se.se],
+        ]
+        next_cells = []
+        for y in (1, 2):
+            for x in (1, 2):
+                neighbors = -cells[y][x].population
+                for row in cells[y - 1:y + 2]:
+                    for cell in row[x - 1:x + 2]:
+                        neighbors += cell.population
+                alive = cells[y][x].population
+                if neighbors == 3 or (neighbors == 2 and alive):
+                    next_cells.append(self.on)
+                else:
+                    next_cells.append(self.off)
+        return self.join(*next_cells)
+
+    def successor(self, node, step):
+        # Centre half of node, 2**step generations later
+        step = min(step, node.level - 2)
+        key = (node, step)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+
+        if node.population == 0:
+            result = node.nw
+        elif node.level == 2:
+            result = self._life_4x4(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            c1 = self.successor(nw, step)
+            c2 = self.successor(self.join(nw.ne, ne.nw, nw.se, ne.sw), step)
+            c3 = self.successor(ne, step)
+            c4 = self.successor(self.join(nw.sw, nw.se, sw.nw, sw.ne), step)
+            c5 = self.successor(self.join(nw.se, ne.sw, sw.ne, se.nw), step)
+            c6 = self.successor(self.join(ne.sw, ne.se, se.nw, se.ne), step)
+            c7 = self.successor(sw, step)
+            c8 = self.successor(self.join(sw.ne, se.nw, sw.se, se.sw), step)
+            c9 = self.successor(se, step)
+
+            if step < node.level - 2:
+                result = self.join(
+                    self.join(c1.se, c2.sw, c4.ne, c5.nw),
+                    self.join(c2.se, c3.sw, c5.ne, c6.nw),
+                    self.join(c4.se, c5.sw, c7.ne, c8.nw),
+                    self.join(c5.se, c6.sw, c8.ne, c9.nw),
+                )
+            else:
+                result = self.join(
+                    self.successor(self.join(c1, c2, c4, c5), step),
+                    self.successor(self.join(c2, c3, c5, c6), step),
+                    self.successor(self.join(c4, c5, c7, c8), step),
+                    self.successor(self.join(c5, c6, c8, c9), step),
+                )
+
+        self.results.put(key, result)
+        return result
+
+    def collect(self, *roots):
+        # Drop every cached node and result that the given roots don't reach
+        self.nodes.clear()
+        self.results.clear()
+        self.empties.clear()
+        seen = set()
+        pending = [root for root in roots if root.level > 0]
+        while pending:
+            node = pending.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            self.nodes.put((node.nw, node.ne, node.sw, node.se), node)
+            for child in (node.nw, node.ne, node.sw, node.se):
+                if child.level > 0:
+                    pending.append(child)
+
+
+def is_padded(node):
+    # All live cells sit in the central quarter of the node
+    return node.level >= 3 and (
+        node.nw.population == node.nw.se.se.population and
+        node.ne.population == node.ne.sw.sw.population and
+        node.sw.population == node.sw.ne.ne.population and
+        node.se.population == node.se.nw.nw.population
+    )
+
+
+class QuadtreeGrid:
+
+    def __init__(self, height, width, engine=None):
+        self.height = height
+        self.width = width
+        self.engine = HashLife() if engine is None else engine
+        level = max(3, (max(height, width) - 1).bit_length())
+        self.root = self.engine.empty(level)
+        # Board coordinates of the top-left corner of the root node
+        self.y = 0
+        self.x = 0
+        self.generation = 0
+
+    def _build(self, level, cells):
+        if not cells:
+            return self.engine.empty(level)
+        if level == 0:
+            return self.engine.on
+        half = 1 << (level - 1)
+        quadrants = ([], [], [], [])
+        for y, x in cells:
+            index = (y >= half) * 2 + (x >= half)
+            quadrants[index].append((y % half, x % half))
+        return self.engine.join(
+            *(self._build(level - 1, cells) for cells in quadrants)
+        )
+
+    def _collect_cells(self, node, y, x, cells):
+        if node.population == 0:
+            return
+        if node.level == 0:
+            cells.append((y, x))
+            return
+        half = 1 << (node.level - 1)
+        self._collect_cells(node.nw, y, x, cells)
+        self._collect_cells(node.ne, y, x + half, cells)
+        self._collect_cells(node.sw, y + half, x, cells)
+        self._collect_cells(node.se, y + half, x + half, cells)
+
+    def alive_cells(self):
+        cells = []
+        self._collect_cells(self.root, self.y, self.x, cells)
+        return cells
+
+    def get(self, y, x):
+        y -= self.y
+        x -= self.x
+        node = self.root
+        size = 1 << node.level
+        if not (0 <= y < size and 0 <= x < size):
+            return EMPTY
+        while node.level > 0 and node.population:
+            half = 1 << (node.level - 1)
+            if y < half:
+                node = node.nw if x < half else node.ne
+            else:
+                node = node.sw if x < half else node.se
+            y %= half
+            x %= half
+        return ALIVE if node.population else EMPTY
+
+    def _set_cell(self, node, y, x, leaf):
+        if node.level == 0:
+            return leaf
+        half = 1 << (node.level - 1)
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        if y < half and x < half:
+            nw = self._set_cell(nw, y, x, leaf)
+        elif y < half:
+            ne = self._set_cell(ne, y, x - half, leaf)
+        elif x < half:
+            sw = self._set_cell(sw, y - half, x, leaf)
+        else:
+            se = self._set_cell(se, y - half, x - half, leaf)
+        return self.engine.join(nw, ne, sw, se)
+
+    def set(self, y, x, state):
+        while not (
+            0 <= y - self.y < 1 << self.root.level and
+            0 <= x - self.x < 1 << self.root.level
+        ):
+            self._pad()
+        leaf = self.engine.on if state == ALIVE else self.engine.off
+        self.root = self._set_cell(self.root, y - self.y, x - self.x, leaf)
+
+    def load(self, cells):
+        level = max(3, (max(self.height, self.width) - 1).bit_length())
+        for y, x in cells:
+            while not (0 <= y < 1 << level and 0 <= x < 1 << level):
+                level += 1
+        self.y = 0
+        self.x = 0
+        self.root = self._build(level, list(cells))
+
+    def __str__(self):
+        return str(self.to_grid())
+
+    @classmethod
+    def from_grid(cls, grid, engine=None):
+        quadtree = cls(grid.height, grid.width, engine)
+        cells = []
+        for y in range(grid.height):
+            for x in range(grid.width):
+                if grid.get(y, x) == ALIVE:
+                    cells.append((y, x))
+        quadtree.load(cells)
+        return quadtree
+
+    def to_grid(self):
+        grid = Grid(self.height, self.width)
+        for y, x in self.alive_cells():
+            if 0 <= y < self.height and 0 <= x < self.width:
+                grid.rows[y][x] = ALIVE
+        return grid
+
+    def _pad(self):
+        half = 1 << (self.root.level - 1)
+        self.root = self.engine.centre(self.root)
+        self.y -= half
+        self.x -= half
+
+    def advance(self, generations):
+        # Jump by the power-of-two pieces of generations, smallest first
+        while generations:
+            step = (generations & -generations).bit_length() - 1
+            while self.root.level < step + 3 or not is_padded(self.root):
+                self._pad()
+            quarter = 1 << (self.root.level - 2)
+            self.root = self.engine.successor(self.root, step)
+            self.y += quarter
+            self.x += quarter
+            generations -= 1 << step
+            self.generation += 1 << step
+
+    def collect(self):
+        self.engine.collect(self.root)
+
+
+@profiled
+def simulate_hashlife(grid, generations=1, engine=None):
+    quadtree = QuadtreeGrid.from_grid(grid, engine)
+    quadtree.advance(generations)
+    return quadtree.to_grid()
+
+
+def test_simulate_hashlife():
+    from cnp.conway.arraygrid import ArrayGrid, simulate_vectorized
+
+    # A glider well clear of the edges for the first few hundred generations
+    grid = Grid(256, 256)
+    for y, x in ((1, 2), (2, 3), (3, 1), (3, 2), (3, 3)):
+        grid.set(y + 20, x + 20, ALIVE)
+    quadtree = QuadtreeGrid.from_grid(grid)
+    array_grid = ArrayGrid.from_grid(grid)
+    for generations in (1, 2, 5, 16, 100):
+        quadtree.advance(generations)
+        for _ in range(generations):
+            array_grid = simulate_vectorized(array_grid)
+        assert str(quadtree) == str(array_grid)
+        quadtree.collect()
+
+
+@timer
+def test_column_printer_with_hashlife():
+    columns = ColumnPrinter("Grids Columns with hashlife")
+    simulated_columns = ColumnPrinter("Grids Columns after 1024 generations")
+
+    engine = HashLife()
+    for i in range(5):
+        grid = Grid(15, 15)
+        for _ in range(20):
+            y = random.randrange(5, 10)
+            x = random.randrange(5, 10)
+            grid.set(y, x, ALIVE)
+        columns.append(str(grid))
+        grid = simulate_hashlife(grid, 1024, engine)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
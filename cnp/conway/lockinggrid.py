@@ -3,9 +3,13 @@ import random
 import contextlib
 from threading import Lock, Thread
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 from cnp.conway.grid import (
-    Grid, ColumnPrinter, step_cell, set_grid_random_cells_alive
+    Grid,
+    ColumnPrinter,
+    step_cell,
+    step_cells,
+    set_grid_random_cells_alive
 )
 
 
@@ -23,46 +27,65 @@ class LockingGrid(Grid):
         with self.lock:
             return super().set(y, x, state)
 
-    def __str__(self):
+    def write(self, stream):
         with self.lock:
-            return super().__str__()
+            return super().write(stream)
 
 
+@profiled
 def simulate_threading(grid):
-    next_grid = LockingGrid(grid.height, grid.width)
+    next_grid = grid.next_generation(LockingGrid)
 
     threads = []
-    for y in range(grid.height):
-        for x in range(grid.width):
-            args = (y, x, grid.get, next_grid.set)
-            thread = Thread(target=step_cell, args=args)
-            thread.start()
-            threads.append(thread)
+    for y, x in grid.cells_to_step():
+        args = (y, x, grid.get, next_grid.set_next)
+        thread = Thread(target=step_cell, args=args)
+        thread.start()
+        threads.append(thread)
+    print(f'Thread count: {len(threads)}')
+    for thread in threads:
+        thread.join()
+
+    return next_grid.swap()
+
+
+@profiled
+def simulate_threading_chunked(grid, chunk_size=None):
+    next_grid = grid.next_generation(LockingGrid)
+    if chunk_size is None:
+        chunk_size = grid.width
+
+    threads = []
+    for cells in grid.chunks_to_step(chunk_size):
+        args = (cells, grid.get, next_grid.set_next)
+        thread = Thread(target=step_cells, args=args)
+        thread.start()
+        threads.append(thread)
     print(f'Thread count: {len(threads)}')
     for thread in threads:
         thread.join()
 
-    return next_grid
+    return next_grid.swap()
 
 
+@profiled
 def simulate_threading_with_redirection(grid):
-    next_grid = LockingGrid(grid.height, grid.width)
+    next_grid = grid.next_generation(LockingGrid)
 
     threads = []
     fake_stderr = io.StringIO()
     with contextlib.redirect_stderr(fake_stderr):
-        for y in range(grid.height):
-            for x in range(grid.width):
-                args = (y, x, grid.get, next_grid.set)
-                thread = Thread(target=step_cell, args=args)
-                thread.start()
-                threads.append(thread)
+        for y, x in grid.cells_to_step():
+            args = (y, x, grid.get, next_grid.set_next)
+            thread = Thread(target=step_cell, args=args)
+            thread.start()
+            threads.append(thread)
         print(f'Thread count: {len(threads)}')
         for thread in threads:
             thread.join()
     print(fake_stderr.getvalue())
 
-    return next_grid
+    return next_grid.swap()
 
 
 @timer
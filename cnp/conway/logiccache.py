@@ -0,0 +1,230 @@
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Event, Lock, Thread
+
+from rich import print
+from cnp.utils import timer
+from cnp.conway import asyncgrid
+from cnp.conway.grid import (
+    Grid, ColumnPrinter, game_logic, simulate, set_grid_random_cells_alive
+)
+
+_MISSING = object()
+
+
+class ResultStore:
+    # LRU entries that also expire ttl seconds after being stored
+
+    def __init__(self, max_size=1024, ttl=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or self.clock() < expires_at:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return _MISSING
+
+    def store(self, key, value):
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class LogicCache:
+    # Thread-safe stand-in for game_logic. Concurrent misses on the same key
+    # wait for the one call already in flight instead of making their own.
+
+    def __init__(
+        self, logic=game_logic, max_size=1024, ttl=None, clock=time.monotonic
+    ):
+        self.logic = logic
+        self.results = ResultStore(max_size, ttl, clock)
+        self.in_flight = {}
+        self.lock = Lock()
+
+    def __call__(self, state, neighbors):
+        key = (state, neighbors)
+        with self.lock:
+            value = self.results.lookup(key)
+            if value is not _MISSING:
+                return value
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = self.logic(state, neighbors)
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            self.results.store(key, value)
+            del self.in_flight[key]
+        future.set_result(value)
+        return value
+
+
+class AsyncLogicCache:
+    # Awaitable counterpart of LogicCache for asyncgrid.game_logic and
+    # GameLogicBatcher. Everything runs on one loop, so there is no lock.
+
+    def __init__(
+        self, logic=asyncgrid.game_logic, max_size=1024, ttl=None,
+        clock=time.monotonic
+    ):
+        self.logic = logic
+        self.results = ResultStore(max_size, ttl, clock)
+        self.in_flight = {}
+
+    async def __call__(self, state, neighbors):
+        key = (state, neighbors)
+        value = self.results.lookup(key)
+        if value is not _MISSING:
+            return value
+
+        task = self.in_flight.get(key)
+        if task is None:
+            # The call runs in its own task, so cancelling whichever caller
+            # started it leaves the call, and everyone else awaiting the
+            # same key, untouched
+            task = asyncio.ensure_future(self._fill(key, state, neighbors))
+            task.add_done_callback(_retrieve_exception)
+            self.in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, state, neighbors):
+        try:
+            value = await self.logic(state, neighbors)
+        finally:
+            del self.in_flight[key]
+        self.results.store(key, value)
+        return value
+
+
+def _retrieve_exception(task):
+    # Every caller may have been cancelled before the call failed
+    if not task.cancelled():
+        task.exception()
+
+
+def test_logic_cache():
+    now = [0.0]
+    calls = []
+    release = Event()
+
+    def logic(state, neighbors):
+        calls.append((state, neighbors))
+        release.wait()
+        return f'{state}{neighbors}'
+
+    # Every thread misses; only the first one calls logic
+    cache = LogicCache(logic, max_size=2, ttl=10, clock=lambda: now[0])
+    results = []
+    threads = [
+        Thread(target=lambda: results.append(cache('*', 3)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    while cache.results.misses < 8:
+        time.sleep(.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['*3'] * 8
+    assert calls == [('*', 3)]
+
+    # Expired after ttl seconds
+    now[0] = 9.9
+    assert cache('*', 3) == '*3' and len(calls) == 1
+    now[0] = 10
+    assert cache('*', 3) == '*3' and len(calls) == 2
+
+    # The least recently used key goes once max_size is reached
+    cache('-', 3)
+    cache('*', 3)
+    cache('-', 2)
+    assert len(calls) == 4
+    cache('*', 3)
+    assert len(calls) == 4
+    cache('-', 3)
+    assert len(calls) == 5
+
+    async def run():
+        gate = asyncio.Event()
+        async_calls = []
+
+        async def async_logic(state, neighbors):
+            async_calls.append((state, neighbors))
+            await gate.wait()
+            return f'{state}{neighbors}'
+
+        cache = AsyncLogicCache(async_logic, ttl=10, clock=lambda: now[0])
+        owner = asyncio.ensure_future(cache('*', 2))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(cache('*', 2)) for _ in range(5)]
+        await asyncio.sleep(0)
+
+        # Cancelling the coroutine that started the call leaves it running
+        # for everyone else
+        owner.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*waiters) == ['*2'] * 5
+        assert owner.cancelled()
+        assert async_calls == [('*', 2)]
+
+        assert await cache('*', 2) == '*2' and len(async_calls) == 1
+        now[0] += 10
+        assert await cache('*', 2) == '*2' and len(async_calls) == 2
+
+    asyncio.run(run())
+
+
+@timer
+def test_column_printer_with_cache():
+    columns = ColumnPrinter("Grids Columns")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns with cache")
+    async_columns = ColumnPrinter("Simulated Grids Columns with async cache")
+
+    logic = LogicCache(ttl=60)
+    async_logic = AsyncLogicCache(ttl=60)
+    for i in range(5):
+        grid = Grid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        simulated_columns.append(str(simulate(grid, logic)))
+        async_grid = asyncio.run(asyncgrid.simulate(grid, async_logic))
+        async_columns.append(str(async_grid))
+
+    print(columns)
+    print(simulated_columns)
+    print(async_columns)
+    print(f'Cache hits {logic.results.hits}, misses {logic.results.misses}')
@@ -0,0 +1,130 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import ColumnPrinter, set_grid_random_cells_alive
+from cnp.conway.arraygrid import ArrayGrid, step_cells_array
+
+# Front and back buffers attached once per worker process
+_worker_buffers = []
+_worker_shape = None
+
+
+def _attach_buffers(names, shape):
+    global _worker_shape
+    _worker_shape = shape
+    for name in names:
+        _worker_buffers.append(SharedMemory(name=name))
+
+
+def _as_array(shared_memory, shape):
+    return np.ndarray(shape, dtype=np.uint8, buffer=shared_memory.buf)
+
+
+def _step_band(front_index, y0, y1):
+    front = _as_array(_worker_buffers[front_index], _worker_shape)
+    back = _as_array(_worker_buffers[1 - front_index], _worker_shape)
+    # Read the band plus one halo row above and below, wrapping around
+    rows = np.arange(y0 - 1, y1 + 1) % _worker_shape[0]
+    back[y0:y1] = step_cells_array(front[rows])[1:-1]
+
+
+def split_bands(height, count):
+    count = max(1, min(count, height))
+    edges = [height * i // count for i in range(count + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+class TiledSimulator:
+
+    def __init__(self, height, width, max_workers=None, band_count=None):
+        self.height = height
+        self.width = width
+        if max_workers is None:
+            max_workers = os.cpu_count()
+        if band_count is None:
+            band_count = max_workers
+        self.bands = split_bands(height, band_count)
+        size = max(1, height * width)
+        self.buffers = [SharedMemory(create=True, size=size) for _ in range(2)]
+        self.front = 0
+        names = [buffer.name for buffer in self.buffers]
+        self.pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach_buffers,
+            initargs=(names, (height, width)),
+        )
+
+    def load(self, grid):
+        if not isinstance(grid, ArrayGrid):
+            grid = ArrayGrid.from_grid(grid)
+        front = _as_array(self.buffers[self.front], (self.height, self.width))
+        front[:] = grid.cells
+
+    def step(self, generations=1):
+        for _ in range(generations):
+            futures = [
+                self.pool.submit(_step_band, self.front, y0, y1)
+                for y0, y1 in self.bands
+            ]
+            for future in futures:
+                future.result()
+            self.front = 1 - self.front
+
+    def snapshot(self):
+        front = _as_array(self.buffers[self.front], (self.height, self.width))
+        return ArrayGrid(self.height, self.width, front.copy())
+
+    def close(self):
+        self.pool.shutdown()
+        for buffer in self.buffers:
+            buffer.close()
+            buffer.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@profiled
+def simulate_tiled(simulator, grid):
+    simulator.load(grid)
+    simulator.step()
+    return simulator.snapshot()
+
+
+def test_simulate_tiled():
+    from cnp.conway.arraygrid import simulate_vectorized
+
+    cells = (np.random.random((37, 23)) < 0.4).astype(np.uint8)
+    grid = ArrayGrid(37, 23, cells)
+    with TiledSimulator(37, 23, max_workers=3, band_count=5) as simulator:
+        simulator.load(grid)
+        simulator.step(10)
+        result = simulator.snapshot()
+    for _ in range(10):
+        grid = simulate_vectorized(grid)
+    assert str(result) == str(grid)
+
+
+@timer
+def test_column_printer_with_processes():
+    columns = ColumnPrinter("Grids Columns with processes")
+    simulated_columns = ColumnPrinter("Simulated Grids Columns with processes")
+
+    with TiledSimulator(15, 15, max_workers=4) as simulator:
+        for i in range(5):
+            grid = ArrayGrid(15, 15)
+            set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+            columns.append(str(grid))
+            grid = simulate_tiled(simulator, grid)
+            simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
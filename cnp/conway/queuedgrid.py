@@ -1,6 +1,6 @@
 import random
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 from cnp.use_queue import ClosableQueue, StoppableWorker
 from cnp.conway.grid import (
     Grid,
@@ -24,24 +24,24 @@ class SimulationError(Exception):
     ...
 
 
+@profiled
 def simulate_pipeline(grid, in_queue, out_queue):
-    for y in range(grid.height):
-        for x in range(grid.width):
-            state = grid.get(y, x)
-            neighbors = count_neighbors(y, x, grid.get)
-            in_queue.put((y, x, state, neighbors))
+    for y, x in grid.cells_to_step():
+        state = grid.get(y, x)
+        neighbors = count_neighbors(y, x, grid.get)
+        in_queue.put((y, x, state, neighbors))
 
     in_queue.join()
     out_queue.close()
 
-    next_grid = Grid(grid.height, grid.width)
+    next_grid = grid.next_generation(Grid)
     for item in out_queue:
         y, x, next_state = item
         if isinstance(next_state, Exception):
             raise SimulationError(y, x) from next_state
-        next_grid.set(y, x, next_state)
+        next_grid.set_next(y, x, next_state)
 
-    return next_grid
+    return next_grid.swap()
 
 
 @timer
@@ -1,6 +1,6 @@
 import random
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 from cnp.use_queue import ClosableQueue, StoppableWorker
 from cnp.conway.lockinggrid import LockingGrid
 from cnp.conway.grid import (
@@ -33,25 +33,121 @@ class SimulationError(Exception):
     ...
 
 
+@profiled
 def simulate_phased_pipeline(grid, in_queue, logic_queue, out_queue):
-    for y in range(grid.height):
-        for x in range(grid.width):
-            state = grid.get(y, x)
-            item = (y, x, state, grid.get)
-            in_queue.put(item)
+    for y, x in grid.cells_to_step():
+        state = grid.get(y, x)
+        item = (y, x, state, grid.get)
+        in_queue.put(item)
 
     in_queue.join()
     logic_queue.join()
     out_queue.close()
 
-    next_grid = LockingGrid(grid.height, grid.width)
+    next_grid = grid.next_generation(LockingGrid)
     for item in out_queue:
         y, x, next_state = item
         if isinstance(next_state, Exception):
             raise SimulationError(y, x) from next_state
-        next_grid.set(y, x, next_state)
+        next_grid.set_next(y, x, next_state)
 
-    return next_grid
+    return next_grid.swap()
+
+
+def count_neighbors_wave_thread(item):
+    generation, *cell = item
+    return (generation, *count_neighbors_thread(cell))
+
+
+def game_logic_wave_thread(item):
+    generation, *cell = item
+    return (generation, *game_logic_thread(cell))
+
+
+@profiled
+def simulate_wavefront(grid, generations, in_queue, logic_queue, out_queue):
+    # Row y of generation g + 1 only needs rows y - 1, y and y + 1 of
+    # generation g, so it is queued as soon as those are complete instead of
+    # waiting for the whole of generation g to drain through the stages
+    height, width = grid.height, grid.width
+    grids = {0: grid}
+    finished = {}
+    scheduled = {}
+
+    def row_complete(generation, y):
+        return generation == 0 or finished.get((generation, y)) == width
+
+    def schedule(generation, y):
+        previous = grids[generation - 1]
+        if generation not in grids:
+            grids[generation] = LockingGrid(height, width)
+        for x in range(width):
+            state = previous.get(y, x)
+            in_queue.put((generation, y, x, state, previous.get))
+        scheduled[generation] = scheduled.get(generation, 0) + 1
+        if scheduled[generation] == height and generation > 1:
+            # Queued items keep their own reference to the grid they read
+            del grids[generation - 1]
+
+    if generations == 0:
+        return grid
+
+    for y in range(height):
+        schedule(1, y)
+
+    pending = {(1, y) for y in range(height)}
+    remaining = generations * height * width
+    while remaining:
+        generation, y, x, next_state = out_queue.get()
+        out_queue.task_done()
+        if isinstance(next_state, Exception):
+            raise SimulationError(y, x) from next_state
+        grids[generation].set(y, x, next_state)
+        remaining -= 1
+
+        key = (generation, y)
+        finished[key] = finished.get(key, 0) + 1
+        if finished[key] < width or generation == generations:
+            continue
+        for row in {(y - 1) % height, y, (y + 1) % height}:
+            next_key = (generation + 1, row)
+            if next_key in pending:
+                continue
+            neighborhood = ((row - 1) % height, row, (row + 1) % height)
+            if all(row_complete(generation, r) for r in neighborhood):
+                pending.add(next_key)
+                schedule(generation + 1, row)
+
+    return grids[generations]
+
+
+def test_simulate_wavefront():
+    from cnp.use_queue import start_threads, stop_threads
+    from cnp.conway.sparsegrid import SparseGrid, simulate_sparse
+
+    in_queue = ClosableQueue()
+    logic_queue = ClosableQueue()
+    out_queue = ClosableQueue()
+    count_threads = start_threads(
+        8, count_neighbors_wave_thread, in_queue, logic_queue
+    )
+    logic_threads = start_threads(
+        32, game_logic_wave_thread, logic_queue, out_queue
+    )
+
+    for height, width in ((1, 1), (3, 5), (8, 8)):
+        grid = LockingGrid(height, width)
+        set_grid_random_cells_alive(grid, 0.4)
+        expected = SparseGrid.from_grid(grid)
+        for generations in range(6):
+            result = simulate_wavefront(
+                grid, generations, in_queue, logic_queue, out_queue
+            )
+            assert str(result) == str(expected)
+            expected = simulate_sparse(expected)
+
+    stop_threads(in_queue, count_threads)
+    stop_threads(logic_queue, logic_threads)
 
 
 @timer
@@ -90,3 +186,45 @@ def test_column_printer_with_phased_pipeline():
         logic_queue.close()
     for thread in threads:
         thread.join()
+
+
+@timer
+def test_column_printer_with_wavefront():
+    columns = ColumnPrinter("Grids Columns with wavefront")
+    simulated_columns = ColumnPrinter("Grids Columns after 3 generations")
+
+    in_queue = ClosableQueue()
+    logic_queue = ClosableQueue()
+    out_queue = ClosableQueue()
+
+    threads = []
+    for _ in range(5):
+        thread = StoppableWorker(
+            count_neighbors_wave_thread, in_queue, logic_queue
+        )
+        thread.start()
+        threads.append(thread)
+
+    for _ in range(5):
+        thread = StoppableWorker(
+            game_logic_wave_thread, logic_queue, out_queue
+        )
+        thread.start()
+        threads.append(thread)
+
+    for i in range(5):
+        grid = LockingGrid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grid = simulate_wavefront(grid, 3, in_queue, logic_queue, out_queue)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
+
+    for thread in threads:
+        in_queue.close()
+    for thread in threads:
+        logic_queue.close()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,352 @@
+"""
+Binary snapshots of Conway grids.
+
+A snapshot is a 64-byte header followed by the cells packed the way BitGrid
+keeps them in memory: each row as little-endian uint64 words, 64 cells per
+word. Uncompressed snapshots can therefore be memory-mapped straight into a
+BitGrid without copying.
+"""
+
+import os
+import zlib
+import struct
+import random
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from rich import print
+from cnp.utils import timer
+from cnp.conway.grid import Grid
+from cnp.conway.arraygrid import ArrayGrid
+from cnp.conway.bitgrid import BitGrid, words_per_row
+
+MAGIC = b'CNPG'
+VERSION = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_RLE = 2
+
+# magic, version, compression, height, width, generation, payload size
+HEADER = struct.Struct('<4sBB2xQQQQ')
+HEADER_SIZE = 64
+
+
+class SnapshotError(Exception):
+    ...
+
+
+# Compressed payloads are written and read this many words at a time, so
+# neither side ever holds more than a block beyond the grid itself
+BLOCK_WORDS = 1 << 17
+READ_SIZE = 1 << 20
+
+
+def row_blocks(words, block_words=BLOCK_WORDS):
+    # The packed bytes of a few rows at a time, without copying
+    rows = max(1, block_words // max(1, words.shape[1]))
+    for start in range(0, words.shape[0], rows):
+        yield words[start:start + rows].reshape(-1).view(np.uint8)
+
+
+def encode_varints(values):
+    # LEB128: seven bits per byte, low bits first, high bit set on all but
+    # the last byte of each value
+    values = values.astype(np.uint64)
+    sizes = np.ones(values.size, np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(sizes.sum()), np.uint8)
+    index = np.cumsum(sizes) - sizes
+    while values.size:
+        more = values > 0x7f
+        out[index] = (values & np.uint64(0x7f)).astype(np.uint8) | (
+            more.astype(np.uint8) << 7
+        )
+        values = values[more] >> np.uint64(7)
+        index = index[more] + 1
+    return out.tobytes()
+
+
+def decode_varints(data):
+    # data must end on the last byte of a value
+    data = np.frombuffer(data, np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = np.arange(data.size) - np.repeat(starts, ends - starts + 1)
+    if shifts.size and shifts.max() > 9:
+        raise SnapshotError('Run length overflows 64 bits')
+    parts = (data & 0x7f).astype(np.uint64) << (7 * shifts).astype(np.uint64)
+    return np.add.reduceat(parts, starts) if starts.size else parts
+
+
+def rle_encode(blocks):
+    # Lengths of alternating runs of dead and alive cells over the packed
+    # bits, padding included, starting with a (possibly empty) dead run.
+    # Yields the varint-encoded lengths one block at a time.
+    value = 0
+    run = 0
+    for block in blocks:
+        size = block.size * 8
+        if not block.any() or (block == 0xff).all():
+            first = int(block[0] == 0xff) if block.size else value
+            if first == value:
+                run += size
+            else:
+                yield encode_varints(np.array([run]))
+                value, run = first, size
+            continue
+
+        bits = np.unpackbits(block, bitorder='little')
+        changes = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+        lengths = [[run] if bits[0] == value else [run, 0]]
+        lengths[0][-1] += changes[0] if changes.size else size
+        lengths.append(np.diff(changes))
+        yield encode_varints(np.concatenate(lengths))
+        value = int(bits[-1])
+        run = size - changes[-1] if changes.size else size
+    yield encode_varints(np.array([run]))
+
+
+def rle_runs(chunks):
+    # Run lengths, decoded a chunk at a time
+    carry = b''
+    for chunk in chunks:
+        data = carry + chunk
+        ends = np.flatnonzero(np.frombuffer(data, np.uint8) < 0x80)
+        last = ends[-1] if ends.size else -1
+        carry = data[last + 1:]
+        if len(carry) > 10:
+            raise SnapshotError('Corrupt run length')
+        if last >= 0:
+            yield decode_varints(data[:last + 1])
+    if carry:
+        raise SnapshotError('Truncated run length')
+
+
+def rle_decode(chunks, out, block_bytes=BLOCK_WORDS * 8):
+    # Fills out, a uint8 array, a block of bytes at a time. Each run ends
+    # where the next one starts, so the cells are the running parity of the
+    # run ends seen so far.
+    value = 0
+    written = 0
+    total = 0
+    pending = np.empty(0, np.uint64)
+    for lengths in rle_runs(chunks):
+        ends = np.cumsum(lengths, dtype=np.uint64) + np.uint64(total)
+        if ends.size:
+            total = int(ends[-1])
+        if total > out.size * 8:
+            raise SnapshotError('Payload does not match the grid size')
+        pending = np.concatenate((pending, ends))
+        while written < total // 8:
+            stop = min(total // 8, written + block_bytes)
+            count = int(np.searchsorted(pending, stop * 8))
+            if not count:
+                out[written:stop] = 0xff if value else 0
+            else:
+                # An empty first run puts two ends on the same bit
+                positions, repeats = np.unique(
+                    pending[:count] - np.uint64(written * 8),
+                    return_counts=True
+                )
+                toggles = np.zeros((stop - written) * 8, np.uint8)
+                toggles[positions[repeats % 2 == 1].astype(np.int64)] = 1
+                bits = (np.cumsum(toggles, dtype=np.uint8) + value) & 1
+                out[written:stop] = np.packbits(bits, bitorder='little')
+                value = (value + count) & 1
+                pending = pending[count:]
+            written = stop
+    if total != out.size * 8:
+        raise SnapshotError('Payload does not match the grid size')
+
+
+def zlib_encode(blocks):
+    compressor = zlib.compressobj()
+    for block in blocks:
+        yield compressor.compress(block)
+    yield compressor.flush()
+
+
+def zlib_decode(chunks, out):
+    decompressor = zlib.decompressobj()
+    written = 0
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, READ_SIZE)
+            if written + len(data) > out.size:
+                raise SnapshotError('Payload does not match the grid size')
+            out[written:written + len(data)] = np.frombuffer(data, np.uint8)
+            written += len(data)
+            chunk = decompressor.unconsumed_tail
+    if not decompressor.eof or written != out.size:
+        raise SnapshotError('Payload does not match the grid size')
+
+
+def read_chunks(handle, size):
+    while size:
+        chunk = handle.read(min(size, READ_SIZE))
+        if not chunk:
+            raise SnapshotError('Truncated payload')
+        size -= len(chunk)
+        yield chunk
+
+
+def to_bit_grid(grid):
+    if isinstance(grid, BitGrid):
+        return grid
+    if isinstance(grid, ArrayGrid):
+        return BitGrid.from_cells(grid.cells)
+    return BitGrid.from_grid(grid)
+
+
+def save(grid, path, generation=0, compression=COMPRESSION_NONE):
+    # Falls back to no compression as soon as the payload outgrows the
+    # packed words, e.g. for a dense random board. Returns the compression
+    # actually used.
+    bit_grid = to_bit_grid(grid)
+    words = bit_grid.words.astype('<u8', copy=False)
+    if compression == COMPRESSION_NONE:
+        encoder = None
+    elif compression == COMPRESSION_ZLIB:
+        encoder = zlib_encode
+    elif compression == COMPRESSION_RLE:
+        encoder = rle_encode
+    else:
+        raise SnapshotError(f'Unknown compression {compression}')
+
+    with open(path, 'wb') as handle:
+        handle.seek(HEADER_SIZE)
+        payload_size = 0
+        if encoder is not None:
+            for chunk in encoder(row_blocks(words)):
+                payload_size += len(chunk)
+                if payload_size > words.nbytes:
+                    handle.seek(HEADER_SIZE)
+                    handle.truncate()
+                    compression = COMPRESSION_NONE
+                    break
+                handle.write(chunk)
+        if compression == COMPRESSION_NONE:
+            payload_size = words.nbytes
+            words.tofile(handle)
+
+        handle.seek(0)
+        header = HEADER.pack(
+            MAGIC, VERSION, compression, bit_grid.height, bit_grid.width,
+            generation, payload_size
+        )
+        handle.write(header.ljust(HEADER_SIZE, b'\0'))
+    return compression
+
+
+def read_header(handle):
+    data = handle.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise SnapshotError('Truncated header')
+    magic, version, compression, height, width, generation, payload_size = (
+        HEADER.unpack_from(data)
+    )
+    if magic != MAGIC:
+        raise SnapshotError(f'Not a grid snapshot: {magic!r}')
+    if version != VERSION:
+        raise SnapshotError(f'Unsupported snapshot version {version}')
+    return compression, height, width, generation, payload_size
+
+
+def load(path):
+    with open(path, 'rb') as handle:
+        compression, height, width, generation, payload_size = (
+            read_header(handle)
+        )
+        words = np.empty((height, words_per_row(width)), '<u8')
+        out = words.reshape(-1).view(np.uint8)
+        chunks = read_chunks(handle, payload_size)
+        if compression == COMPRESSION_NONE:
+            if payload_size != out.size:
+                raise SnapshotError('Payload does not match the grid size')
+            if handle.readinto(out) != out.size:
+                raise SnapshotError('Truncated payload')
+        elif compression == COMPRESSION_ZLIB:
+            zlib_decode(chunks, out)
+        elif compression == COMPRESSION_RLE:
+            rle_decode(chunks, out)
+        else:
+            raise SnapshotError(f'Unknown compression {compression}')
+
+    grid = BitGrid(height, width, words.astype(np.uint64, copy=False))
+    return grid, generation
+
+
+def load_mmap(path, mode='r'):
+    # mode 'r' is read-only, 'c' copy-on-write and 'r+' writes back to disk
+    with open(path, 'rb') as handle:
+        compression, height, width, generation, _ = read_header(handle)
+    if compression != COMPRESSION_NONE:
+        raise SnapshotError('Only uncompressed snapshots can be mapped')
+
+    shape = (height, words_per_row(width))
+    words = np.memmap(path, '<u8', mode, offset=HEADER_SIZE, shape=shape)
+    return BitGrid(height, width, words), generation
+
+
+@timer
+def test_snapshot():
+    from cnp.conway.bitgrid import simulate_bits
+
+    cells = (np.random.random((300, 517)) < random.uniform(0.01, 0.5))
+    grid = BitGrid.from_cells(cells.astype(np.uint8))
+    with TemporaryDirectory() as directory:
+        for compression in (
+            COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_RLE
+        ):
+            path = os.path.join(directory, f'grid-{compression}.cnpg')
+            used = save(grid, path, generation=42, compression=compression)
+            loaded, generation = load(path)
+            assert generation == 42
+            assert str(loaded) == str(grid)
+            assert os.path.getsize(path) <= HEADER_SIZE + grid.words.nbytes
+            print(
+                f'Compression {compression} (used {used}): '
+                f'{os.path.getsize(path)} bytes'
+            )
+
+        path = os.path.join(directory, 'grid-0.cnpg')
+        mapped, generation = load_mmap(path)
+        assert str(simulate_bits(mapped)) == str(simulate_bits(grid))
+        del mapped
+
+        path = os.path.join(directory, 'small.cnpg')
+        small = Grid(3, 4)
+        small.set(1, 2, '*')
+        save(small, path)
+        loaded, _ = load(path)
+        assert str(loaded) == str(small)
+
+        # A mostly empty board shrinks; a dense random one is stored as is
+        sparse = np.zeros((500, 700), np.uint8)
+        sparse[100:103, 200:203] = 1
+        dense = (np.random.random((64, 256)) < .5).astype(np.uint8)
+        for cells, expected in ((sparse, COMPRESSION_RLE), (dense, 0)):
+            path = os.path.join(directory, 'rle.cnpg')
+            board = BitGrid.from_cells(cells)
+            assert save(board, path, compression=COMPRESSION_RLE) == expected
+            loaded, _ = load(path)
+            assert (loaded.words == board.words).all()
+        assert os.path.getsize(path) == HEADER_SIZE + dense.nbytes // 8
+
+    # Runs that cross row blocks and chunks that split a run length
+    for cells in (
+        np.zeros((7, 130), np.uint8),
+        np.ones((7, 130), np.uint8),
+        (np.random.random((7, 130)) < .05).astype(np.uint8),
+        (np.random.random((7, 130)) < .95).astype(np.uint8),
+    ):
+        words = BitGrid.from_cells(cells).words.astype('<u8')
+        payload = b''.join(rle_encode(row_blocks(words, block_words=1)))
+        chunks = [payload[i:i + 3] for i in range(0, len(payload), 3)]
+        out = np.empty(words.nbytes, np.uint8)
+        rle_decode(chunks, out, block_bytes=5)
+        assert out.tobytes() == words.tobytes()
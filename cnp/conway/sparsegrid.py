@@ -0,0 +1,129 @@
+import io
+import random
+from collections import Counter, defaultdict
+
+from rich import print
+from cnp.utils import profiled, timer
+from cnp.conway.grid import (
+    ALIVE,
+    EMPTY,
+    NEIGHBOR_OFFSETS,
+    Grid,
+    ColumnPrinter,
+    set_grid_random_cells_alive
+)
+
+
+class SparseGrid:
+
+    def __init__(self, height, width, alive=None):
+        self.height = height
+        self.width = width
+        self.alive = set() if alive is None else alive
+
+    def get(self, y, x):
+        if (y % self.height, x % self.width) in self.alive:
+            return ALIVE
+        return EMPTY
+
+    def set(self, y, x, state):
+        position = (y % self.height, x % self.width)
+        if state == ALIVE:
+            self.alive.add(position)
+        else:
+            self.alive.discard(position)
+
+    def write(self, stream):
+        # Only one row is materialized at a time
+        columns = defaultdict(list)
+        for y, x in self.alive:
+            columns[y].append(x)
+        empty_row = EMPTY * self.width + '\n'
+        for y in range(self.height):
+            if y not in columns:
+                stream.write(empty_row)
+                continue
+            row = [EMPTY] * self.width
+            for x in columns[y]:
+                row[x] = ALIVE
+            stream.write(''.join(row))
+            stream.write('\n')
+
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_grid(cls, grid):
+        alive = set()
+        for y, row in enumerate(grid.rows):
+            for x, cell in enumerate(row):
+                if cell == ALIVE:
+                    alive.add((y, x))
+        return cls(grid.height, grid.width, alive)
+
+    def to_grid(self):
+        grid = Grid(self.height, self.width)
+        for y, x in self.alive:
+            grid.rows[y][x] = ALIVE
+        return grid
+
+
+def count_neighbor_hits(grid):
+    # Only live cells and their frontier ever receive a hit. Wrapped offsets
+    # that land on the same cell count twice, just like count_neighbors.
+    height, width = grid.height, grid.width
+    hits = Counter()
+    for y, x in grid.alive:
+        for dy, dx in NEIGHBOR_OFFSETS:
+            hits[(y + dy) % height, (x + dx) % width] += 1
+    return hits
+
+
+@profiled
+def simulate_sparse(grid):
+    alive = grid.alive
+    next_alive = set()
+    for position, neighbors in count_neighbor_hits(grid).items():
+        if neighbors == 3 or (neighbors == 2 and position in alive):
+            next_alive.add(position)
+    return SparseGrid(grid.height, grid.width, next_alive)
+
+
+def test_simulate_sparse():
+    from cnp.conway.grid import step_cell
+
+    grid = Grid(5, 6)
+    grid.set(0, 3, ALIVE)
+    grid.set(1, 4, ALIVE)
+    grid.set(2, 2, ALIVE)
+    grid.set(2, 3, ALIVE)
+    grid.set(2, 4, ALIVE)
+
+    expected = Grid(grid.height, grid.width)
+    for y in range(grid.height):
+        for x in range(grid.width):
+            step_cell(y, x, grid.get, expected.set)
+
+    sparse_grid = simulate_sparse(SparseGrid.from_grid(grid))
+    assert str(sparse_grid) == str(expected)
+    assert str(sparse_grid.to_grid()) == str(expected)
+
+
+@timer
+def test_column_printer_with_sparse():
+    columns = ColumnPrinter("Grids Columns with sparse set")
+    simulated_columns = ColumnPrinter(
+        "Simulated Grids Columns with sparse set"
+    )
+
+    for i in range(5):
+        grid = SparseGrid(15, 15)
+        set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+        columns.append(str(grid))
+        grid = simulate_sparse(grid)
+        simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
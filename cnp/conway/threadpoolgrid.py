@@ -1,32 +1,98 @@
 from concurrent.futures import ThreadPoolExecutor
 
+import os
+import math
+import time
 import random
+import weakref
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 from cnp.use_queue import ClosableQueue, StoppableWorker
 from cnp.conway.lockinggrid import LockingGrid
 from cnp.conway.grid import (
     ColumnPrinter,
     game_logic,
     step_cell,
+    step_cells,
     count_neighbors,
     set_grid_random_cells_alive
 )
 
 
-def simulate_pool(pool, grid):
-    next_grid = LockingGrid(grid.height, grid.width)
+@profiled
+def simulate_pool(pool, grid, logic=game_logic):
+    next_grid = grid.next_generation(LockingGrid)
 
     futures = []
-    for y in range(grid.height):
-        for x in range(grid.width):
-            args = (y, x, grid.get, next_grid.set)
-            future = pool.submit(step_cell, *args)
-            futures.append(future)
+    for y, x in grid.cells_to_step():
+        args = (y, x, grid.get, next_grid.set_next, logic)
+        future = pool.submit(step_cell, *args)
+        futures.append(future)
     for future in futures:
         future.result()
 
-    return next_grid
+    return next_grid.swap()
+
+
+# Share of a chunk's run time that per-task overhead is allowed to take
+TASK_OVERHEAD_BUDGET = 0.05
+CHUNKS_PER_WORKER = 4
+
+
+def measure_task_overhead(pool, samples=32):
+    start = time.perf_counter()
+    futures = [pool.submit(int) for _ in range(samples)]
+    for future in futures:
+        future.result()
+    return (time.perf_counter() - start) / samples
+
+
+def pick_chunk_size(pool, grid, max_workers=None, cell_cost=None):
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if cell_cost is None:
+        # The result is thrown away, so there is no grid to write it to
+        start = time.perf_counter()
+        step_cell(0, 0, grid.get, lambda *args: None)
+        cell_cost = time.perf_counter() - start
+
+    overhead = measure_task_overhead(pool)
+    chunk_size = math.ceil(overhead / (cell_cost * TASK_OVERHEAD_BUDGET))
+    # Never leave workers idle for the sake of fewer tasks
+    cell_count = grid.height * grid.width
+    most = math.ceil(cell_count / (max_workers * CHUNKS_PER_WORKER))
+    return max(1, min(chunk_size, most))
+
+
+# Chunk sizes measured per pool and board shape, dropped with the pool
+_chunk_sizes = weakref.WeakKeyDictionary()
+
+
+def cached_chunk_size(pool, grid, max_workers=None):
+    sizes = _chunk_sizes.setdefault(pool, {})
+    key = (grid.height, grid.width, max_workers)
+    if key not in sizes:
+        sizes[key] = pick_chunk_size(pool, grid, max_workers)
+    return sizes[key]
+
+
+@profiled
+def simulate_pool_chunked(pool, grid, chunk_size=None, max_workers=None):
+    # Without a chunk_size, the first generation on a pool measures one and
+    # later generations on the same pool and board shape reuse it
+    next_grid = grid.next_generation(LockingGrid)
+    if chunk_size is None:
+        chunk_size = cached_chunk_size(pool, grid, max_workers)
+
+    futures = []
+    for cells in grid.chunks_to_step(chunk_size):
+        args = (cells, grid.get, next_grid.set_next)
+        future = pool.submit(step_cells, *args)
+        futures.append(future)
+    for future in futures:
+        future.result()
+
+    return next_grid.swap()
 
 
 @timer
@@ -44,3 +110,22 @@ def test_column_printer_with_pool():
 
     print(columns)
     print(simulated_columns)
+
+
+@timer
+def test_column_printer_with_chunked_pool():
+    columns = ColumnPrinter("Grids Columns with chunked pool")
+    simulated_columns = ColumnPrinter(
+        "Simulated Grids Columns with chunked pool"
+    )
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        for i in range(5):
+            grid = LockingGrid(15, 15)
+            set_grid_random_cells_alive(grid, random.uniform(0.06, 0.8))
+            columns.append(str(grid))
+            grid = simulate_pool_chunked(pool, grid, max_workers=20)
+            simulated_columns.append(str(grid))
+
+    print(columns)
+    print(simulated_columns)
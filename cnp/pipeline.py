@@ -0,0 +1,168 @@
+from rich import print
+from cnp.utils import timer
+from cnp.use_queue import (
+    ClosableQueue, StoppableWorker, download, resize, upload, start_threads,
+    stop_threads
+)
+from cnp.process_stage import start_process_stage
+
+
+class StageSpec:
+    # fuse=True always folds the stage into a neighbour's worker loop,
+    # fuse=False never does (though light neighbours may still join it), and
+    # None leaves it to the service time: cost, a side-effect-free estimate
+    # in seconds per item, or else what the stage's workers measured in the
+    # pipeline's last run. With processes set, the stage's group runs in
+    # that many worker processes instead of threads.
+
+    def __init__(
+        self, func, name=None, workers=1, fuse=None, processes=0, cost=None
+    ):
+        self.func = func
+        self.name = name or func.__name__
+        self.workers = workers
+        self.fuse = fuse
+        self.processes = processes
+        self.cost = cost
+
+
+def stage(func, name=None, workers=1, fuse=None, processes=0, cost=None):
+    return StageSpec(func, name, workers, fuse, processes, cost)
+
+
+class chain:
+    # One worker loop running several stages back to back. A class rather
+    # than a closure so process stages can pickle it.
+
+    def __init__(self, funcs):
+        self.funcs = funcs
+
+    def __call__(self, item):
+        for func in self.funcs:
+            item = func(item)
+        return item
+
+
+class Pipeline:
+
+    def __init__(self, stages, fuse_below=.002, queue_factory=ClosableQueue):
+        if not stages:
+            raise ValueError('A pipeline needs at least one stage')
+        self.stages = list(stages)
+        self.fuse_below = fuse_below
+        self.queue_factory = queue_factory
+        self.groups = None
+        self.queues = None
+        self.threads = None
+        # Seconds per item of each stage in the last run, None where unknown
+        self.service_times = [None] * len(self.stages)
+
+    def record_service_times(self):
+        # Only a stage that ran alone on threads has times of its own; a
+        # fused group's workers time the whole chain
+        service_times = []
+        for group, workers in zip(self.groups, self.threads):
+            processed = busy_time = 0
+            for worker in workers:
+                if isinstance(worker, StoppableWorker):
+                    processed += worker.processed
+                    busy_time += worker.busy_time
+            if len(group) == 1 and processed:
+                service_times.append(busy_time / processed)
+            else:
+                service_times.extend([None] * len(group))
+        self.service_times = service_times
+
+    def plan(self):
+        # A light stage joins the group before it; a group of nothing but
+        # light stages (a light first stage) takes the next stage in too.
+        # A stage with neither a cost nor a measurement is only fused when
+        # annotated.
+        light = []
+        for spec, measured in zip(self.stages, self.service_times):
+            service_time = measured if spec.cost is None else spec.cost
+            if spec.fuse is not None:
+                light.append(spec.fuse)
+            elif service_time is None:
+                light.append(False)
+            else:
+                light.append(service_time < self.fuse_below)
+
+        groups = []
+        for spec, is_light in zip(self.stages, light):
+            if groups and (is_light or all(
+                was_light for _, was_light in groups[-1]
+            )):
+                groups[-1].append((spec, is_light))
+            else:
+                groups.append([(spec, is_light)])
+        self.groups = [[spec for spec, _ in group] for group in groups]
+        return self.groups
+
+    def start(self):
+        if self.groups is None:
+            self.plan()
+        self.queues = [
+            self.queue_factory() for _ in range(len(self.groups) + 1)
+        ]
+        self.threads = []
+        for group, in_queue, out_queue in zip(
+            self.groups, self.queues, self.queues[1:]
+        ):
+            func = group[0].func if len(group) == 1 else chain(
+                [spec.func for spec in group]
+            )
+            processes = max(spec.processes for spec in group)
+            if processes:
+                workers = start_process_stage(
+                    func, in_queue, out_queue, processes
+                )
+            else:
+                workers = start_threads(
+                    max(spec.workers for spec in group),
+                    func, in_queue, out_queue
+                )
+            self.threads.append(workers)
+        return self.queues[0], self.queues[-1]
+
+    def stop(self):
+        for in_queue, threads in zip(self.queues, self.threads):
+            stop_threads(in_queue, threads)
+        self.record_service_times()
+        return self.queues[-1]
+
+    def describe(self):
+        return ' -> '.join(
+            '+'.join(spec.name for spec in group) for group in self.groups
+        )
+
+
+def pass_through(func):
+    # The use_queue stages return None; keep the item moving instead
+    def inner(item):
+        func(item)
+        return item
+    inner.__name__ = func.__name__
+    return inner
+
+
+@timer
+def commence_task_flow_with_pipeline(auto_fuse=True):
+    # The first wave runs every stage on its own; with auto_fuse, the
+    # second is planned from the service times the first one measured
+    pipeline = Pipeline([
+        stage(pass_through(download), workers=3),
+        stage(pass_through(resize), workers=4),
+        stage(pass_through(upload), workers=5),
+    ])
+    for wave in range(1, 3):
+        if wave == 1 or auto_fuse:
+            pipeline.plan()
+        print(f'Wave {wave} stages: {pipeline.describe()}')
+
+        in_queue, done_queue = pipeline.start()
+        for _ in range(1000):
+            in_queue.put(object())
+        pipeline.stop()
+
+        print(f'{done_queue.qsize()} items finished')
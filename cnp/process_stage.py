@@ -0,0 +1,239 @@
+import os
+import time
+import pickle
+import multiprocessing
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+from threading import Thread
+
+from rich import print
+from cnp.utils import timer
+from cnp.use_queue import (
+    ClosableQueue, start_threads, stop_threads, upload
+)
+
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+# How often the collector checks for worker processes that died
+POLL_INTERVAL = .1
+
+
+class SharedPayload:
+    # Stands in for a large bytes item while it crosses a process boundary;
+    # whoever unshares it owns (and unlinks) the segment
+    __slots__ = ('name', 'size')
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __getstate__(self):
+        return self.name, self.size
+
+    def __setstate__(self, state):
+        self.name, self.size = state
+
+
+def share(item, threshold=SHARED_MEMORY_THRESHOLD):
+    if not isinstance(item, (bytes, bytearray)) or len(item) < threshold:
+        return item
+    segment = SharedMemory(create=True, size=len(item))
+    segment.buf[:len(item)] = item
+    segment.close()
+    return SharedPayload(segment.name, len(item))
+
+
+def unshare(item):
+    if not isinstance(item, SharedPayload):
+        return item
+    segment = SharedMemory(item.name)
+    try:
+        return bytes(segment.buf[:item.size])
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def process_worker(func, tasks, results, threshold):
+    # Each task is (batch_id, items) and gets back (batch_id, results,
+    # errors); None means no more tasks, and is answered with the worker's
+    # pid so the collector knows it is done. Results are pickled here, not
+    # in the queue's feeder thread, which would only log a failure and drop
+    # the whole message; errors travel as their repr for the same reason.
+    while True:
+        task = tasks.get()
+        if task is None:
+            results.put(os.getpid())
+            return
+        batch_id, items = task
+        out = []
+        errors = []
+        for item in items:
+            try:
+                result = share(func(unshare(item)), threshold)
+                out.append(pickle.dumps(result))
+            except Exception as exc:
+                errors.append(repr(exc))
+        results.put((batch_id, out, errors))
+
+
+class ProcessStage(Thread):
+    # A drop-in for a pool of StoppableWorkers that runs func in worker
+    # processes. The thread feeds batches from in_queue to the processes
+    # and a collector thread forwards their results to out_queue. A batch
+    # is only marked done in in_queue after its results are in out_queue,
+    # and the sentinel only after every batch, so close() and join() keep
+    # their ClosableQueue meaning. func must be picklable. Processes come
+    # from a forkserver by default: forking this thread would copy locks
+    # other stage threads may be holding.
+
+    def __init__(
+        self, func, in_queue, out_queue, workers=2, batch_size=32,
+        shm_threshold=SHARED_MEMORY_THRESHOLD, mp_context=None
+    ):
+        super().__init__()
+        context = mp_context or multiprocessing.get_context(
+            'forkserver'
+            if 'forkserver' in multiprocessing.get_all_start_methods()
+            else 'spawn'
+        )
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.batch_size = batch_size
+        self.shm_threshold = shm_threshold
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=process_worker,
+                args=(func, self.tasks, self.results, shm_threshold),
+                daemon=True,
+            )
+            for _ in range(workers)
+        ]
+        self.pending = {}
+        self.errors = []
+
+    def run(self):
+        # Segments are created in one process and unlinked in another, so
+        # all of them must report to the same resource tracker
+        resource_tracker.ensure_running()
+        for process in self.processes:
+            process.start()
+        collector = Thread(target=self.collect)
+        collector.start()
+
+        batch_id = 0
+        while True:
+            items = self.in_queue.get_many(self.batch_size)
+            closed = items[-1] is self.in_queue.SENTINEL
+            if closed:
+                items.pop()
+            if items:
+                self.pending[batch_id] = len(items)
+                shared = [share(item, self.shm_threshold) for item in items]
+                self.tasks.put((batch_id, shared))
+                batch_id += 1
+            if closed:
+                break
+
+        for _ in self.processes:
+            self.tasks.put(None)
+        collector.join()
+        for process in self.processes:
+            process.join()
+        # Batches a dead worker took with it, or that were queued after
+        # every worker had died
+        for batch_id, count in self.pending.items():
+            self.fail(batch_id, count, 'lost with its worker process')
+        self.pending.clear()
+        # The sentinel, now that everything queued before it is forwarded
+        self.in_queue.task_done()
+
+    def collect(self):
+        finished = set()
+        while len(finished) < len(self.processes):
+            try:
+                message = self.results.get(timeout=POLL_INTERVAL)
+            except Empty:
+                # A killed worker never answers its None
+                for process in self.processes:
+                    if process.exitcode not in (None, 0) and \
+                            process.pid not in finished:
+                        print(
+                            f'Worker process {process.pid} died with exit '
+                            f'code {process.exitcode}'
+                        )
+                        finished.add(process.pid)
+                continue
+            if isinstance(message, int):
+                finished.add(message)
+                continue
+            batch_id, results, errors = message
+            for error in errors:
+                self.fail(batch_id, 0, error)
+            self.out_queue.put_many(
+                unshare(pickle.loads(result)) for result in results
+            )
+            self.in_queue.task_done(self.pending.pop(batch_id))
+
+    def fail(self, batch_id, count, error):
+        # Failed items are dropped, as if their worker thread had died on
+        # them, but they still count as done
+        print(f'Item in batch {batch_id} failed: {error}')
+        self.errors.append(error)
+        if count:
+            self.in_queue.task_done(count)
+
+
+def start_process_stage(func, in_queue, out_queue, workers=2, **kwargs):
+    # Same shape as start_threads, so stop_threads() shuts it down
+    stage = ProcessStage(func, in_queue, out_queue, workers, **kwargs)
+    stage.start()
+    return [stage]
+
+
+def fetch(item):
+    # Network I/O mock returning an image-sized payload
+    time.sleep(.003)
+    return os.urandom(256 * 1024)
+
+
+def thumbnail(data):
+    # CPU-bound: averages every 4 bytes in pure Python, holding the GIL
+    return bytes(sum(data[i:i + 4]) // 4 for i in range(0, len(data), 4))
+
+
+def store(data):
+    upload(data)
+    return len(data)
+
+
+@timer
+def commence_task_flow_with_process_stage(use_processes=True, count=200):
+    fetch_queue = ClosableQueue()
+    thumbnail_queue = ClosableQueue()
+    store_queue = ClosableQueue()
+    done_queue = ClosableQueue()
+
+    fetch_threads = start_threads(4, fetch, fetch_queue, thumbnail_queue)
+    if use_processes:
+        thumbnail_workers = start_process_stage(
+            thumbnail, thumbnail_queue, store_queue,
+            workers=os.cpu_count(), batch_size=8
+        )
+    else:
+        thumbnail_workers = start_threads(
+            os.cpu_count(), thumbnail, thumbnail_queue, store_queue
+        )
+    store_threads = start_threads(4, store, store_queue, done_queue)
+
+    for _ in range(count):
+        fetch_queue.put(object())
+
+    stop_threads(fetch_queue, fetch_threads)
+    stop_threads(thumbnail_queue, thumbnail_workers)
+    stop_threads(store_queue, store_threads)
+
+    stored = sum(done_queue.queue)
+    print(f'{done_queue.qsize()} items finished, {stored} bytes stored')
@@ -0,0 +1,182 @@
+import math
+import time
+from threading import Event, Thread
+
+from rich import print
+from cnp.utils import timer
+from cnp.use_queue import ClosableQueue, StoppableWorker
+
+
+class Stage:
+    # The pool of StoppableWorkers draining one queue into the next
+
+    def __init__(
+        self, name, func, in_queue, out_queue, min_workers=1, max_workers=8,
+        batch_size=None
+    ):
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError('Need 1 <= min_workers <= max_workers')
+        self.name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.threads = []
+        # Sentinels sent by shrink(); each one retires exactly one worker
+        self.retired = 0
+
+    @property
+    def workers(self):
+        # Workers that will keep running: retiring ones are still alive
+        # until their sentinel works its way through the backlog
+        return len(self.threads) - self.retired
+
+    @property
+    def live_threads(self):
+        return sum(thread.is_alive() for thread in self.threads)
+
+    def start(self):
+        for _ in range(self.min_workers):
+            self.grow()
+
+    def grow(self):
+        # Counted against live threads, not workers, so retiring workers
+        # still draining the backlog keep the stage within max_workers
+        if self.live_threads >= self.max_workers:
+            return False
+        thread = StoppableWorker(
+            self.func, self.in_queue, self.out_queue, self.batch_size
+        )
+        thread.start()
+        self.threads.append(thread)
+        return True
+
+    def shrink(self):
+        # Whichever worker picks this up exits once the items ahead of it
+        # are handled
+        self.retired += 1
+        self.in_queue.close()
+
+    def stats(self):
+        processed = sum(thread.processed for thread in self.threads)
+        busy_time = sum(thread.busy_time for thread in self.threads)
+        return processed, busy_time
+
+    def stop(self):
+        for _ in range(self.workers):
+            self.in_queue.close()
+        self.in_queue.join()
+        for thread in self.threads:
+            thread.join()
+
+
+class StageSupervisor(Thread):
+    # Every interval, sizes each stage for the items arriving at it
+    # (Little's law: arrival rate * service time), plus enough extra workers
+    # to clear its backlog within drain_time. Grows at once, shrinks one
+    # worker per interval so a short lull doesn't tear the pool down.
+
+    def __init__(self, stages, interval=.1, drain_time=.5, on_scale=None):
+        super().__init__(daemon=True)
+        self.stages = stages
+        self.interval = interval
+        self.drain_time = drain_time
+        self.on_scale = on_scale
+        self.stopped = Event()
+        self.samples = {stage.name: (0, 0.0, 0) for stage in stages}
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for stage in self.stages:
+                self.rebalance(stage)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def target_workers(self, stage):
+        processed, busy_time = stage.stats()
+        depth = stage.in_queue.qsize()
+        last_processed, last_busy_time, last_depth = self.samples[stage.name]
+        self.samples[stage.name] = (processed, busy_time, depth)
+
+        done = processed - last_processed
+        if not done:
+            # Nothing finished: either idle, or every worker is stuck on an
+            # item slower than the interval
+            return stage.workers + 1 if depth else stage.workers
+
+        service_time = (busy_time - last_busy_time) / done
+        arrival_rate = max(0, done + depth - last_depth) / self.interval
+        needed = (arrival_rate + depth / self.drain_time) * service_time
+        return math.ceil(needed)
+
+    def rebalance(self, stage):
+        target = self.target_workers(stage)
+        target = max(stage.min_workers, min(stage.max_workers, target))
+        current = stage.workers
+        if target > current:
+            grown = 0
+            while grown < target - current and stage.grow():
+                grown += 1
+            if not grown:
+                return
+        elif target < current:
+            stage.shrink()
+        else:
+            return
+        if self.on_scale is not None:
+            self.on_scale(stage, current, stage.workers)
+
+
+def sleeping_stage(latencies, name):
+    def func(item):
+        time.sleep(latencies[name])
+        return item
+    return func
+
+
+def log_scaling(stage, before, after):
+    print(f'{stage.name}: {before} -> {after} workers')
+
+
+@timer
+def commence_task_flow_with_autoscaling(max_workers=8):
+    # Between the two waves download and upload swap latencies, so the
+    # bottleneck moves from the last stage to the first
+    latencies = {'download': .003, 'resize': .001, 'upload': .005}
+    queues = [ClosableQueue() for _ in range(4)]
+    stages = [
+        Stage(
+            name, sleeping_stage(latencies, name), in_queue, out_queue,
+            max_workers=max_workers
+        )
+        for name, in_queue, out_queue in zip(
+            ('download', 'resize', 'upload'), queues, queues[1:]
+        )
+    ]
+    for stage in stages:
+        stage.start()
+    supervisor = StageSupervisor(stages, on_scale=log_scaling)
+    supervisor.start()
+
+    done_queue = queues[-1]
+    for wave in range(1, 3):
+        for _ in range(1000):
+            queues[0].put(object())
+        # A worker forwards an item before marking it done, so joining the
+        # stage queues in order returns once the wave is through them all
+        for in_queue in queues[:-1]:
+            in_queue.join()
+        print(f'Wave {wave} done, {done_queue.qsize()} items so far')
+        latencies['download'], latencies['upload'] = .005, .003
+
+    # Stop scaling before the stages shut down, or a late grow() would
+    # start a worker that never gets its sentinel
+    supervisor.stop()
+    for stage in stages:
+        stage.stop()
+
+    print(f'{done_queue.qsize()} items finished')
@@ -0,0 +1,246 @@
+import math
+import time
+from threading import Event, Lock, Thread, local
+
+from rich import print
+from cnp.utils import timer
+from cnp.use_queue import (
+    ClosableQueue, download, resize, upload, start_threads, stop_threads
+)
+
+# Each power of two is split into 8 buckets, so a recorded value is off by
+# at most 12.5%, whatever its magnitude
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_bounds(index):
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = index // SUB_BUCKETS - 1
+    low = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return low, low + (1 << shift)
+
+
+class Histogram:
+    # Log-linear buckets in the style of HdrHistogram. Values are counted in
+    # multiples of unit (microseconds by default). record() takes no lock:
+    # give each writing thread its own histogram and merge them to read.
+
+    def __init__(self, unit=1e-6):
+        self.unit = unit
+        self.counts = [0] * (64 * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        scaled = max(0, int(value / self.unit))
+        self.counts[bucket_index(scaled)] += 1
+        self.count += 1
+        self.total += scaled
+        if scaled > self.max:
+            self.max = scaled
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @classmethod
+    def merged(cls, histograms, unit=1e-6):
+        result = cls(unit)
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                low, high = bucket_bounds(index)
+                return min((low + high - 1) / 2, self.max) * self.unit
+        return self.max * self.unit
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0
+        return {
+            'count': self.count,
+            'mean': mean * self.unit,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max * self.unit,
+        }
+
+
+class StageTelemetry:
+    # Everything measured about one stage: how long items wait in its input
+    # queue, how long its workers spend on each, how deep the queue gets and
+    # how busy each worker is. Pass it as telemetry= to the stage's
+    # ClosableQueue and StoppableWorkers.
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = None
+        self.workers = []
+        self.wait_shards = []
+        self.depths = Histogram(unit=1)
+        self.lock = Lock()
+        self.local = local()
+
+    def attach_queue(self, queue):
+        self.queue = queue
+
+    def add_worker(self, worker):
+        # Returns the worker's own service time histogram
+        with self.lock:
+            self.workers.append(worker)
+        return Histogram()
+
+    def record_wait(self, seconds):
+        histogram = getattr(self.local, 'waits', None)
+        if histogram is None:
+            histogram = self.local.waits = Histogram()
+            with self.lock:
+                self.wait_shards.append(histogram)
+        histogram.record(seconds)
+
+    def sample_depth(self):
+        # Only the exporter thread samples, so depths has a single writer
+        if self.queue is not None:
+            self.depths.record(self.queue.qsize())
+
+    def snapshot(self):
+        # Read while workers are still writing, so counts can be a few items
+        # apart between fields
+        now = time.perf_counter()
+        with self.lock:
+            wait_shards = list(self.wait_shards)
+            workers = list(self.workers)
+
+        worker_stats = []
+        for worker in workers:
+            started_at = worker.started_at
+            if started_at is None:
+                continue
+            elapsed = (worker.finished_at or now) - started_at
+            worker_stats.append({
+                'worker': worker.name,
+                'processed': worker.processed,
+                'utilization': worker.busy_time / elapsed if elapsed else 0,
+            })
+        utilization = sum(
+            stats['utilization'] for stats in worker_stats
+        ) / max(1, len(worker_stats))
+
+        return {
+            'stage': self.name,
+            'depth': self.queue.qsize() if self.queue is not None else 0,
+            'depth_samples': self.depths.summary(),
+            'wait': Histogram.merged(wait_shards).summary(),
+            'service': Histogram.merged(
+                worker.service_times for worker in workers
+            ).summary(),
+            'utilization': utilization,
+            'workers': worker_stats,
+        }
+
+
+def bottleneck(snapshots):
+    # The stage whose workers have the least slack
+    if not snapshots:
+        return None
+    return max(snapshots, key=lambda snapshot: snapshot['utilization'])
+
+
+def print_snapshots(snapshots):
+    for snapshot in snapshots:
+        print(
+            f'{snapshot["stage"]}: depth {snapshot["depth"]}, '
+            f'wait p99 {snapshot["wait"]["p99"] * 1000:.2f}ms, '
+            f'service p50 {snapshot["service"]["p50"] * 1000:.2f}ms, '
+            f'utilization {snapshot["utilization"]:.0%}'
+        )
+    slowest = bottleneck(snapshots)
+    if slowest is not None:
+        print(f'Bottleneck: {slowest["stage"]}')
+
+
+class TelemetryExporter(Thread):
+    # Samples queue depths every sample_interval and hands a snapshot of
+    # every stage to export every interval, and once more on stop()
+
+    def __init__(
+        self, stages, interval=1.0, sample_interval=.01, export=print_snapshots
+    ):
+        super().__init__(daemon=True)
+        self.stages = stages
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.export = export
+        self.stopped = Event()
+
+    def snapshot(self):
+        return [stage.snapshot() for stage in self.stages]
+
+    def run(self):
+        next_export = time.monotonic() + self.interval
+        while not self.stopped.wait(self.sample_interval):
+            for stage in self.stages:
+                stage.sample_depth()
+            if time.monotonic() >= next_export:
+                self.export(self.snapshot())
+                next_export += self.interval
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.export(self.snapshot())
+
+
+@timer
+def commence_task_flow_with_telemetry():
+    stages = [
+        StageTelemetry(name) for name in ('download', 'resize', 'upload')
+    ]
+    download_queue, resize_queue, upload_queue = (
+        ClosableQueue(telemetry=stage) for stage in stages
+    )
+    done_queue = ClosableQueue()
+    exporter = TelemetryExporter(stages, interval=.25)
+    exporter.start()
+
+    download_threads = start_threads(
+        3, download, download_queue, resize_queue, telemetry=stages[0]
+    )
+    resize_threads = start_threads(
+        4, resize, resize_queue, upload_queue, telemetry=stages[1]
+    )
+    upload_threads = start_threads(
+        5, upload, upload_queue, done_queue, telemetry=stages[2]
+    )
+
+    for _ in range(1000):
+        download_queue.put(object())
+
+    stop_threads(download_queue, download_threads)
+    stop_threads(resize_queue, resize_threads)
+    stop_threads(upload_queue, upload_threads)
+    exporter.stop()
+
+    print(f'{done_queue.qsize()} items finished')
@@ -1,33 +1,169 @@
 import time
 from collections import deque
-from queue import Queue
-from threading import Lock, Thread
+from functools import wraps
+from queue import Empty, Full, Queue
+from threading import Condition, Lock, Thread
 
 from rich import print
-from cnp.utils import timer
+from cnp.utils import profiled, timer
 
 
 class MyQueue:
+    # get() blocks until an item arrives instead of failing on an empty
+    # deque; it raises Empty on timeout, or once the queue is closed and
+    # drained. With a maxsize, put() blocks while it is full and raises Full
+    # on timeout. Nothing can be put once the queue is closed.
 
-    def __init__(self):
+    def __init__(self, maxsize=0):
         self.items = deque()
+        self.maxsize = maxsize
         self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+        self.not_full = Condition(self.lock)
+        self.added = Condition(self.lock)
+        self.put_count = 0
+        self.closed = False
 
-    def put(self, item):
+    def put(self, item, timeout=None):
         with self.lock:
+            if self.maxsize > 0 and not self.not_full.wait_for(
+                lambda: len(self.items) < self.maxsize or self.closed,
+                timeout
+            ):
+                raise Full
+            if self.closed:
+                raise ValueError('put to a closed queue')
             self.items.append(item)
+            self.put_count += 1
+            self.not_empty.notify()
+            self.added.notify_all()
 
-    def get(self):
+    def get(self, block=True, timeout=None):
         with self.lock:
-            return self.items.popleft()
+            if block:
+                self.not_empty.wait_for(
+                    lambda: self.items or self.closed, timeout
+                )
+            if not self.items:
+                raise Empty
+            item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    def close(self):
+        # Wakes every blocked get() so idle workers can exit, and every
+        # blocked put() so it can fail
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def wait_for_total(self, count, timeout=None):
+        # Returns once count items have ever been put, without polling
+        with self.lock:
+            return self.added.wait_for(
+                lambda: self.put_count >= count, timeout
+            )
 
 
 class ClosableQueue(Queue):
     SENTINEL = object()
 
+    def __init__(self, maxsize=0, telemetry=None):
+        super().__init__(maxsize)
+        # With telemetry, enqueue times ride along in a parallel deque so the
+        # items themselves stay untouched
+        self.telemetry = telemetry
+        self.enqueued_at = deque()
+        if telemetry is not None:
+            telemetry.attach_queue(self)
+
+    def _put(self, item):
+        self.queue.append(item)
+        if self.telemetry is not None:
+            self.enqueued_at.append(time.perf_counter())
+
+    def _get(self, record=True):
+        item = self.queue.popleft()
+        if self.telemetry is not None:
+            enqueued_at = self.enqueued_at.popleft()
+            # Sentinels and shed items would skew the wait percentiles
+            if record and item is not self.SENTINEL:
+                self.telemetry.record_wait(time.perf_counter() - enqueued_at)
+        return item
+
     def close(self):
         self.put(self.SENTINEL)
 
+    def put_many(self, items, timeout=None):
+        # One lock round trip for the whole batch, unless a bounded queue
+        # fills up midway; then it waits for room and carries on. On timeout
+        # the items already put stay in the queue.
+        items = list(items)
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self.not_full:
+            while items:
+                room = len(items)
+                if self.maxsize > 0:
+                    room = min(room, self.maxsize - self._qsize())
+                if room <= 0:
+                    if timeout is None:
+                        self.not_full.wait()
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Full
+                    self.not_full.wait(remaining)
+                    continue
+                for item in items[:room]:
+                    self._put(item)
+                del items[:room]
+                self.unfinished_tasks += room
+                self.not_empty.notify(room)
+
+    def get_many(self, max_items, timeout=None):
+        # Waits for at least one item, then takes up to max_items. Stops
+        # after a SENTINEL, so each close() still reaches a single consumer.
+        with self.not_empty:
+            if timeout is None:
+                while not self._qsize():
+                    self.not_empty.wait()
+            elif not self.not_empty.wait_for(self._qsize, timeout):
+                raise Empty
+            items = []
+            while self._qsize() and len(items) < max_items:
+                item = self._get()
+                items.append(item)
+                if item is self.SENTINEL:
+                    break
+            self.not_full.notify(len(items))
+            return items
+
+    def task_done(self, count=1):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - count
+            if unfinished <= 0:
+                if unfinished < 0:
+                    raise ValueError('task_done() called too many times')
+                self.all_tasks_done.notify_all()
+            self.unfinished_tasks = unfinished
+
+    def iter_batches(self, max_items):
+        while True:
+            batch = self.get_many(max_items)
+            count = len(batch)
+            try:
+                closed = batch[-1] is self.SENTINEL
+                if closed:
+                    batch.pop()
+                if batch:
+                    yield batch
+                if closed:
+                    return
+            finally:
+                self.task_done(count)
+
     def __iter__(self):
         while True:
             item = self.get()
@@ -40,6 +176,99 @@ class ClosableQueue(Queue):
                 self.task_done()
 
 
+BLOCK = 'block'
+SHED_NEWEST = 'shed_newest'
+SHED_OLDEST = 'shed_oldest'
+
+
+class BoundedQueue(ClosableQueue):
+    # A full queue either blocks the producer or sheds an item: the one being
+    # put (SHED_NEWEST) or the one that waited longest (SHED_OLDEST). close()
+    # is never shed. on_high fires once the size reaches high_watermark and
+    # on_low once it drains back to low_watermark; both run outside the lock.
+
+    def __init__(
+        self, maxsize, policy=BLOCK, high_watermark=None, low_watermark=None,
+        on_high=None, on_low=None, telemetry=None
+    ):
+        if policy not in (BLOCK, SHED_NEWEST, SHED_OLDEST):
+            raise ValueError(f'Unknown policy {policy}')
+        if maxsize <= 0:
+            raise ValueError('BoundedQueue needs a positive maxsize')
+        super().__init__(maxsize, telemetry)
+        self.policy = policy
+        self.high_watermark = maxsize if high_watermark is None \
+            else high_watermark
+        self.low_watermark = maxsize // 2 if low_watermark is None \
+            else low_watermark
+        if not 0 <= self.low_watermark < self.high_watermark <= maxsize:
+            raise ValueError('Need 0 <= low_watermark < high_watermark')
+        self.on_high = on_high
+        self.on_low = on_low
+        self.overloaded = False
+        self.dropped = 0
+        self.peak = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.policy == BLOCK and item is not self.SENTINEL:
+            super().put(item, block, timeout)
+        else:
+            with self.not_full:
+                self._put_or_shed(item)
+        self._check_watermarks()
+
+    def _put_or_shed(self, item):
+        if self._qsize() >= self.maxsize and item is not self.SENTINEL:
+            if self.policy == SHED_NEWEST or self.queue[0] is self.SENTINEL:
+                self.dropped += 1
+                return
+            # The evicted item will never see a task_done()
+            self._get(record=False)
+            self.unfinished_tasks -= 1
+            self.dropped += 1
+        self._put(item)
+        self.unfinished_tasks += 1
+        self.not_empty.notify()
+
+    def put_many(self, items, timeout=None):
+        if self.policy == BLOCK:
+            # A batch that blocks midway would only report on_high once it
+            # is all in, so feed it at most one queue-full at a time
+            items = list(items)
+            for start in range(0, len(items), self.maxsize):
+                super().put_many(items[start:start + self.maxsize], timeout)
+                self._check_watermarks()
+            return
+        with self.not_full:
+            for item in items:
+                self._put_or_shed(item)
+        self._check_watermarks()
+
+    def get(self, block=True, timeout=None):
+        item = super().get(block, timeout)
+        self._check_watermarks()
+        return item
+
+    def get_many(self, max_items, timeout=None):
+        items = super().get_many(max_items, timeout)
+        self._check_watermarks()
+        return items
+
+    def _check_watermarks(self):
+        callback = None
+        with self.mutex:
+            size = self._qsize()
+            self.peak = max(self.peak, size)
+            if not self.overloaded and size >= self.high_watermark:
+                self.overloaded = True
+                callback = self.on_high
+            elif self.overloaded and size <= self.low_watermark:
+                self.overloaded = False
+                callback = self.on_low
+        if callback is not None:
+            callback(self)
+
+
 class Worker(Thread):
 
     def __init__(self, func, in_queue, out_queue):
@@ -54,39 +283,94 @@ class Worker(Thread):
         while True:
             self.polled_count += 1
             try:
+                # Sleeps on the queue's condition until there is work
                 item = self.in_queue.get()
-            except IndexError:
-                time.sleep(.01)
-            else:
-                result = self.func(item)
-                self.out_queue.put(result)
-                self.work_done += 1
+            except Empty:
+                if self.in_queue.closed:
+                    # Closed and drained
+                    return
+                continue
+            result = self.func(item)
+            self.out_queue.put(result)
+            self.work_done += 1
 
 
 class StoppableWorker(Thread):
+    # With a batch_size, func takes a list of up to batch_size items and
+    # returns a list of results, which are forwarded with one put_many
 
-    def __init__(self, func, in_queue, out_queue):
+    def __init__(
+        self, func, in_queue, out_queue, batch_size=None, telemetry=None
+    ):
         super().__init__()
         self.func = func
         self.in_queue = in_queue
         self.out_queue = out_queue
+        self.batch_size = batch_size
+        # Items handled and seconds spent in func, for supervisors
+        self.processed = 0
+        self.busy_time = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self.service_times = None
+        if telemetry is not None:
+            self.service_times = telemetry.add_worker(self)
 
     def run(self):
+        self.started_at = time.perf_counter()
+        try:
+            if self.batch_size:
+                self.run_batches()
+            else:
+                self.run_items()
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def run_items(self):
         for item in self.in_queue:
+            start = time.perf_counter()
             result = self.func(item)
+            elapsed = time.perf_counter() - start
+            self.busy_time += elapsed
+            self.processed += 1
+            if self.service_times is not None:
+                self.service_times.record(elapsed)
             self.out_queue.put(result)
 
+    def run_batches(self):
+        for batch in self.in_queue.iter_batches(self.batch_size):
+            start = time.perf_counter()
+            results = self.func(batch)
+            elapsed = time.perf_counter() - start
+            self.busy_time += elapsed
+            self.processed += len(batch)
+            if self.service_times is not None:
+                # One sample per batch, at the per-item average
+                self.service_times.record(elapsed / len(batch))
+            self.out_queue.put_many(results)
+
+
+def for_each(func):
+    # Turns a per-item stage function into a batched one
+    @wraps(func)
+    def inner(items):
+        return [func(item) for item in items]
+    return inner
 
+
+@profiled
 def download(item):
     # print(f'____downloading {item} ... ')
     time.sleep(.003)
 
 
+@profiled
 def resize(item):
     # print(f'____resizing {item} ... ')
     time.sleep(.001)
 
 
+@profiled
 def upload(item):
     # print(f'____uploading {item} ... ')
     time.sleep(.005)
@@ -111,9 +395,13 @@ def commence_task_flow():
     for _ in range(1000):
         download_queue.put(object())
 
-    while len(done_queue.items) < 1000:
-        print('Waiting for processing...')
-        time.sleep(5)
+    print('Waiting for processing...')
+    done_queue.wait_for_total(1000)
+
+    for queue in (download_queue, resize_queue, upload_queue):
+        queue.close()
+    for thread in threads:
+        thread.join()
 
     processed = len(done_queue.items)
     polled = sum(t.polled_count for t in threads)
@@ -152,8 +440,8 @@ def commence_task_flow_with_queue():
         thread.join()
 
 
-def start_threads(count, *args):
-    threads = [StoppableWorker(*args) for _ in range(count)]
+def start_threads(count, *args, **kwargs):
+    threads = [StoppableWorker(*args, **kwargs) for _ in range(count)]
     for thread in threads:
         thread.start()
     return threads
@@ -186,3 +474,237 @@ def commence_task_flow_with_queue_cleaner():
     stop_threads(upload_queue, upload_thread)
 
     print(f'{done_queue.qsize()} items finished')
+
+
+@timer
+def commence_task_flow_with_batches(batch_size=32):
+    download_queue = ClosableQueue()
+    resize_queue = ClosableQueue()
+    upload_queue = ClosableQueue()
+    done_queue = ClosableQueue()
+
+    download_thread = start_threads(
+        3, for_each(download), download_queue, resize_queue,
+        batch_size=batch_size
+    )
+    resize_thread = start_threads(
+        4, for_each(resize), resize_queue, upload_queue, batch_size=batch_size
+    )
+    upload_thread = start_threads(
+        5, for_each(upload), upload_queue, done_queue, batch_size=batch_size
+    )
+
+    download_queue.put_many(object() for _ in range(1000))
+
+    stop_threads(download_queue, download_thread)
+    stop_threads(resize_queue, resize_thread)
+    stop_threads(upload_queue, upload_thread)
+
+    print(f'{done_queue.qsize()} items finished')
+
+
+def log_watermark(name):
+    def on_high(queue):
+        print(f'{name} queue over high watermark ({queue.high_watermark})')
+
+    def on_low(queue):
+        print(f'{name} queue back under low watermark ({queue.low_watermark})')
+
+    return dict(on_high=on_high, on_low=on_low)
+
+
+@timer
+def commence_task_flow_with_bounded_queues(
+    capacities=(100, 20, 20), policy=BLOCK
+):
+    # One capacity per stage queue: download, resize, upload. Memory stays
+    # flat even though upload (5ms) can't keep up with download (3ms).
+    download_capacity, resize_capacity, upload_capacity = capacities
+    download_queue = BoundedQueue(
+        download_capacity, policy, **log_watermark('download')
+    )
+    resize_queue = BoundedQueue(
+        resize_capacity, policy, **log_watermark('resize')
+    )
+    upload_queue = BoundedQueue(
+        upload_capacity, policy, **log_watermark('upload')
+    )
+    done_queue = ClosableQueue()
+
+    threads = [
+        StoppableWorker(download, download_queue, resize_queue),
+        StoppableWorker(resize, resize_queue, upload_queue),
+        StoppableWorker(upload, upload_queue, done_queue),
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for _ in range(1000):
+        download_queue.put(object())
+
+    download_queue.close()
+    download_queue.join()
+    resize_queue.close()
+    resize_queue.join()
+    upload_queue.close()
+    upload_queue.join()
+
+    for thread in threads:
+        thread.join()
+
+    queues = {
+        'download': download_queue,
+        'resize': resize_queue,
+        'upload': upload_queue,
+    }
+    for name, queue in queues.items():
+        print(f'{name}: peak {queue.peak}, dropped {queue.dropped}')
+    print(f'{done_queue.qsize()} items finished')
+
+
+def test_batched_queue():
+    # A bounded put_many keeps topping up as a get_many consumer drains
+    queue = ClosableQueue(maxsize=7)
+    received = []
+
+    def consume():
+        while len(received) < 100:
+            items = queue.get_many(5)
+            received.extend(items)
+            queue.task_done(len(items))
+
+    consumer = Thread(target=consume)
+    consumer.start()
+    queue.put_many(range(100))
+    consumer.join()
+    assert received == list(range(100))
+    assert queue.unfinished_tasks == 0
+
+    # Each close() ends exactly one iter_batches consumer, after the items
+    # ahead of it
+    batches = []
+    consumers = [
+        Thread(target=lambda: batches.extend(queue.iter_batches(4)))
+        for _ in range(3)
+    ]
+    for consumer in consumers:
+        consumer.start()
+    queue.put_many(range(30))
+    for _ in consumers[1:]:
+        queue.close()
+    queue.join()
+    assert sorted(item for batch in batches for item in batch) == \
+        list(range(30))
+    assert all(0 < len(batch) <= 4 for batch in batches)
+    for consumer in consumers:
+        consumer.join(.2)
+    assert sum(consumer.is_alive() for consumer in consumers) == 1
+    queue.close()
+    queue.join()
+    for consumer in consumers:
+        consumer.join()
+    assert queue.unfinished_tasks == 0 and not queue.qsize()
+
+    # On timeout a full put_many keeps what fit; get_many takes nothing
+    queue = ClosableQueue(maxsize=3)
+    try:
+        queue.put_many(range(5), timeout=.01)
+    except Full:
+        pass
+    else:
+        assert False, 'put_many() should time out on a full queue'
+    assert queue.get_many(10) == [0, 1, 2]
+    queue.task_done(3)
+    try:
+        queue.get_many(10, timeout=.01)
+    except Empty:
+        pass
+    else:
+        assert False, 'get_many() should time out on an empty queue'
+    assert queue.unfinished_tasks == 0
+
+
+def test_bounded_queue():
+    for policy, kept, after_close, closed_out in (
+        (SHED_NEWEST, [0, 1, 2], ['b', None], ['b']),
+        (SHED_OLDEST, [2, 3, 4], [None, 'c'], []),
+    ):
+        queue = BoundedQueue(3, policy)
+        for item in range(5):
+            queue.put(item)
+        assert list(queue.queue) == kept
+        assert queue.dropped == 2
+        assert queue.unfinished_tasks == 3
+        for _ in range(3):
+            queue.get()
+            queue.task_done()
+
+        # Shed items were never counted, so join() doesn't wait for them
+        joiner = Thread(target=queue.join)
+        joiner.start()
+        joiner.join(1)
+        assert not joiner.is_alive()
+
+        # close() goes in over the limit, and a sentinel at the head is
+        # never evicted
+        queue = BoundedQueue(2, policy)
+        queue.put_many(['a', 'b'])
+        queue.close()
+        assert queue.qsize() == 3
+        queue.get()
+        queue.task_done()
+        queue.put('c')
+        queue.put('d')
+        assert [
+            None if item is queue.SENTINEL else item for item in queue.queue
+        ] == after_close
+        assert queue.dropped == 2
+        assert list(queue) == closed_out
+        while queue.qsize():
+            queue.get()
+            queue.task_done()
+        assert queue.unfinished_tasks == 0
+
+    crossings = []
+    queue = BoundedQueue(
+        4, SHED_OLDEST, high_watermark=3, low_watermark=1,
+        on_high=lambda queue: crossings.append('high'),
+        on_low=lambda queue: crossings.append('low'),
+    )
+    queue.put_many(range(6))
+    queue.put(6)
+    assert crossings == ['high']
+    queue.get_many(2)
+    assert crossings == ['high']
+    queue.get()
+    queue.get()
+    assert crossings == ['high', 'low']
+    queue.put(7)
+    queue.put(8)
+    assert crossings == ['high', 'low']
+    queue.put(9)
+    assert crossings == ['high', 'low', 'high']
+    assert queue.peak == 4
+
+    # A blocking batch bigger than the queue reports on_high while it is
+    # still going in, and keeps its order
+    crossings = []
+    queue = BoundedQueue(
+        4, BLOCK, on_high=lambda queue: crossings.append(queue.qsize())
+    )
+    received = []
+
+    def consume():
+        for item in queue:
+            received.append(item)
+
+    consumer = Thread(target=consume)
+    consumer.start()
+    queue.put_many(range(20))
+    queue.join()
+    assert queue.dropped == 0 and queue.peak == 4
+    assert crossings and max(crossings) <= 4
+    queue.close()
+    consumer.join()
+    assert received == list(range(20))
@@ -1,18 +1,189 @@
+import json
 import time
+import asyncio
+import threading
+import tracemalloc
+from contextlib import nullcontext
+from contextvars import ContextVar
 from functools import wraps
 from rich import print
 
+# Path of the span currently open in this thread or asyncio task
+_current_stack = ContextVar('current_stack', default=())
+_DISABLED = nullcontext()
 
-def timer(func):
+METRICS = ('wall', 'cpu', 'thread', 'allocated')
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'token', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = _current_stack.get() + (self.name,)
+        self.token = _current_stack.set(stack)
+        self.start = self.profiler.measure()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = self.profiler.measure()
+        stack = _current_stack.get()
+        _current_stack.reset(self.token)
+        self.profiler.record(
+            stack, [b - a for a, b in zip(self.start, end)]
+        )
+        return False
+
+
+class Profiler:
+    # Aggregates spans by their full stack, e.g. ('simulate', 'game_logic').
+    # Spans opened in a new thread start a new stack; asyncio tasks inherit
+    # the stack of the code that created them.
+
+    def __init__(self):
+        self.enabled = False
+        self.track_allocations = False
+        self.lock = threading.Lock()
+        self.registry = {}
+
+    def enable(self, track_allocations=False):
+        self.track_allocations = track_allocations
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self.track_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_allocations = False
+
+    def reset(self):
+        with self.lock:
+            self.registry = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return _Span(self, name)
+
+    def measure(self):
+        # Allocation deltas are net bytes, so a span that frees more than it
+        # allocates reports a negative number
+        allocated = 0
+        if self.track_allocations:
+            allocated = tracemalloc.get_traced_memory()[0]
+        return (
+            time.perf_counter(),
+            time.process_time(),
+            time.thread_time(),
+            allocated,
+        )
+
+    def record(self, stack, deltas):
+        with self.lock:
+            entry = self.registry.get(stack)
+            if entry is None:
+                entry = self.registry[stack] = [0, 0, 0, 0, 0]
+            entry[0] += 1
+            for i, delta in enumerate(deltas, 1):
+                entry[i] += delta
+
+    def snapshot(self):
+        with self.lock:
+            items = sorted(self.registry.items())
+        return [
+            dict(
+                stack=list(stack),
+                calls=entry[0],
+                **dict(zip(METRICS, entry[1:])),
+            )
+            for stack, entry in items
+        ]
 
+    def export_json(self, stream):
+        json.dump(self.snapshot(), stream, indent=2)
+        stream.write('\n')
+
+    def export_folded(self, stream, metric='wall'):
+        # One "outer;inner count" line per stack, the input format of
+        # flamegraph.pl and speedscope. Counts are self time in microseconds
+        # (or self bytes for 'allocated'), so children aren't counted twice.
+        # Children running concurrently, e.g. under asyncio.gather, can add
+        # up to more than their parent; its self time is then clamped to 0,
+        # but the frame is still written.
+        index = METRICS.index(metric) + 1
+        with self.lock:
+            totals = {
+                stack: entry[index] for stack, entry in self.registry.items()
+            }
+        own = dict(totals)
+        for stack, total in totals.items():
+            if len(stack) > 1 and stack[:-1] in own:
+                own[stack[:-1]] -= total
+
+        scale = 1 if metric == 'allocated' else 1_000_000
+        for stack in sorted(own):
+            value = max(0, round(own[stack] * scale))
+            stream.write(f'{";".join(stack)} {value}\n')
+
+    def print_report(self):
+        for entry in self.snapshot():
+            name = ' > '.join(entry['stack'])
+            print(
+                f'{name}: {entry["calls"]} calls, '
+                f'wall {entry["wall"]: .4f}, cpu {entry["cpu"]: .4f}, '
+                f'thread {entry["thread"]: .4f}, '
+                f'allocated {entry["allocated"]} B'
+            )
+
+
+profiler = Profiler()
+
+
+def span_name(func):
+    # 'grid.simulate' rather than 'simulate': several modules share names
+    return f'{func.__module__.rpartition(".")[2]}.{func.__qualname__}'
+
+
+def span(name):
+    return profiler.span(name)
+
+
+def profiled(func):
+    # Records a span per call while the profiler is enabled; otherwise the
+    # only cost is one attribute check
+    name = span_name(func)
+
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            if not profiler.enabled:
+                return await func(*args, **kwargs)
+            with profiler.span(name):
+                return await func(*args, **kwargs)
+    else:
+        @wraps(func)
+        def inner(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.span(name):
+                return func(*args, **kwargs)
+    return inner
+
+
+def timer(func):
     @wraps(func)
     def inner(*args, **kwargs):
         print(f'Execute {func.__name__}'.center(70, "="))
         start = time.monotonic()
-        result = func(*args, **kwargs)
+        with profiler.span(span_name(func)):
+            result = func(*args, **kwargs)
         end = time.monotonic()
         delta = end - start
         print(f'Elapsed: {delta: .4f}')
         return result
-
-    return inner
\ No newline at end of file
+    return inner
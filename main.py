@@ -16,15 +16,40 @@ from cnp.use_queue import (
     commence_task_flow,
     commence_task_flow_with_queue,
     commence_task_flow_with_queue_cleaner,
+    commence_task_flow_with_batches,
+    commence_task_flow_with_bounded_queues,
 )
+from cnp.supervisor import commence_task_flow_with_autoscaling
+from cnp.pipeline import commence_task_flow_with_pipeline
+from cnp.process_stage import commence_task_flow_with_process_stage
+from cnp.async_queue import commence_async_task_flow
+from cnp.telemetry import commence_task_flow_with_telemetry
 from cnp.conway.grid import (
     test_count_neighbors, test_game_logic, test_step_cell, test_column_printer
 )
 from cnp.conway.lockinggrid import test_column_printer_with_threading
 from cnp.conway.queuedgrid import test_column_printer_with_queue
-from cnp.conway.queuedlockinggrid import test_column_printer_with_phased_pipeline
-from cnp.conway.threadpoolgrid import test_column_printer_with_pool
-from cnp.conway.asyncgrid import test_column_printer_with_asyncio
+from cnp.conway.queuedlockinggrid import (
+    test_column_printer_with_phased_pipeline, test_column_printer_with_wavefront
+)
+from cnp.conway.threadpoolgrid import (
+    test_column_printer_with_pool, test_column_printer_with_chunked_pool
+)
+from cnp.conway.asyncgrid import (
+    test_column_printer_with_asyncio, test_column_printer_with_batched_asyncio,
+    test_profiler
+)
+from cnp.conway.arraygrid import test_column_printer_with_numpy
+from cnp.conway.bitgrid import test_column_printer_with_bits
+from cnp.conway.sparsegrid import test_column_printer_with_sparse
+from cnp.conway.hashlife import test_column_printer_with_hashlife
+from cnp.conway.processgrid import test_column_printer_with_processes
+from cnp.conway.bufferedgrid import test_column_printer_with_double_buffer
+from cnp.conway.logiccache import test_column_printer_with_cache
+from cnp.conway.dirtygrid import test_column_printer_with_dirty_regions
+from cnp.conway.cycles import test_column_printer_with_cycles
+from cnp.conway.snapshot import test_snapshot
+from cnp.conway.batchgrid import test_column_printer_with_batch
 
 from cnp.asyncio_porting.guess import main as guess_main
 from cnp.asyncio_porting.async_guess import run_main_async
@@ -63,6 +88,13 @@ def use_queue():
     commence_task_flow()
     commence_task_flow_with_queue()
     commence_task_flow_with_queue_cleaner()
+    commence_task_flow_with_batches()
+    commence_task_flow_with_bounded_queues()
+    commence_task_flow_with_autoscaling()
+    commence_task_flow_with_pipeline()
+    commence_task_flow_with_process_stage()
+    commence_async_task_flow()
+    commence_task_flow_with_telemetry()
 
 
 def conway_grid():
@@ -75,8 +107,23 @@ def conway_grid():
     # test_column_printer_with_threading(err_redirection=True)
     # test_column_printer_with_queue()
     # test_column_printer_with_phased_pipeline()
+    # test_column_printer_with_wavefront()
     test_column_printer_with_pool()
+    # test_column_printer_with_chunked_pool()
     # test_column_printer_with_asyncio()
+    # test_column_printer_with_batched_asyncio()
+    # test_profiler()
+    # test_column_printer_with_numpy()
+    # test_column_printer_with_bits()
+    # test_column_printer_with_sparse()
+    # test_column_printer_with_hashlife()
+    # test_column_printer_with_processes()
+    # test_column_printer_with_double_buffer()
+    # test_column_printer_with_cache()
+    # test_column_printer_with_dirty_regions()
+    # test_column_printer_with_cycles()
+    # test_snapshot()
+    # test_column_printer_with_batch()
 
 def asyncio_porting():
     # guess_main()